@@ -0,0 +1,80 @@
+"""
+Check the corpus regression mode on a corpus with blank lines.
+
+A baseline is recorded for a synthetic UFO, one kerning pair is changed
+and only the inputs with that pair must be reported, serially and with
+worker processes:
+
+    python benchmarks/corpusRegressionCheck.py
+"""
+import os
+import sys
+import random
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source", "lib"))
+
+import defcon
+
+from featureFont import FeatureFont
+from corpusRegression import CorpusRegression
+from kernFeatureCheck import makeKerningFont, latinCharacters
+
+
+def makeCorpus(count, seed=0):
+    randomizer = random.Random(seed)
+    corpus = []
+    for index in range(count):
+        if index % 7 == 0:
+            # blank lines, as in real word lists
+            corpus.append("")
+        corpus.append("".join(randomizer.sample(latinCharacters[:52], randomizer.randint(2, 8))))
+    return corpus
+
+
+def checkCorpusRegression(workers=None):
+    """
+    Return a list of error messages, empty when the check passes.
+    """
+    compileCache = FeatureFont.compileCache
+    FeatureFont.compileCache = None
+    directory = tempfile.mkdtemp(prefix="corpusRegressionCheck")
+    errors = []
+    try:
+        font, _ = makeKerningFont()
+        path = os.path.join(directory, "font.ufo")
+        font.save(path)
+        corpus = makeCorpus(1000)
+        regression = CorpusRegression(os.path.join(directory, "results.sqlite"), workers=workers, chunkSize=300, workerChunkSize=50)
+        baseline = regression.record(FeatureFont(defcon.Font(path)), corpus)
+
+        # kern a glyph pair that is not kerned yet
+        font = defcon.Font(path)
+        first, second = "uni0041", "uni0056"
+        font.kerning[first, second] = -300
+        font.save()
+        pair = chr(0x41) + chr(0x56)
+        expected = [string for string in corpus if pair in string]
+        changed = list(regression.compare(baseline, FeatureFont(defcon.Font(path)), corpus))
+        regression.close()
+        if changed != expected:
+            errors.append("workers=%s: %d inputs changed, expected %d: %r" % (workers, len(changed), len(expected), sorted(set(changed) ^ set(expected))[:10]))
+    except Exception as error:
+        errors.append("workers=%s: %s: %s" % (workers, error.__class__.__name__, error))
+    finally:
+        FeatureFont.compileCache = compileCache
+        shutil.rmtree(directory)
+    return errors
+
+
+def main():
+    errors = checkCorpusRegression() + checkCorpusRegression(workers=2)
+    for error in errors:
+        print(error)
+    print("corpus regression check %s" % ("FAILED" if errors else "ok"))
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
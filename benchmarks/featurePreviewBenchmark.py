@@ -0,0 +1,287 @@
+"""
+Headless benchmarks for FeatureFont and BinaryFeatureFont.
+
+Synthetic UFOs are generated at several scales, each timing is repeated
+and the results are written as JSON so runs can be compared:
+
+    python benchmarks/featurePreviewBenchmark.py --output before.json
+    python benchmarks/featurePreviewBenchmark.py --output after.json
+    python benchmarks/featurePreviewBenchmark.py --compare before.json after.json
+"""
+import os
+import sys
+import io
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source", "lib"))
+
+import defcon
+import fontTools
+from fontTools.ttLib import TTFont
+from fontTools.fontBuilder import FontBuilder
+
+from featureFont import FeatureFont, BinaryFeatureFont
+from glyphMetrics import GlyphMetrics
+from kernFeatureCheck import compareKernFeatureCompile
+
+
+scales = [
+    dict(name="small", glyphCount=500, kerningPairCount=0, contextualRuleCount=0),
+    dict(name="medium", glyphCount=5000, kerningPairCount=10000, contextualRuleCount=100),
+    dict(name="large", glyphCount=15000, kerningPairCount=50000, contextualRuleCount=500),
+    dict(name="xlarge", glyphCount=30000, kerningPairCount=100000, contextualRuleCount=1000),
+]
+
+shortText = "Hamburgefonstiv"
+paragraphText = ("The quick brown fox jumps over the lazy dog. Sphinx of black quartz, judge my vow. " * 12).strip()
+
+encodedCharacters = [chr(uni) for uni in list(range(0x20, 0x7F)) + list(range(0xA0, 0x250)) + list(range(0x370, 0x3FF)) + list(range(0x400, 0x4FF))]
+
+
+def makeSyntheticFont(path, glyphCount, kerningPairCount, contextualRuleCount, seed=0):
+    """
+    Write a synthetic UFO with encoded glyphs, unencoded alternates,
+    class based kerning and class based contextual substitutions.
+    """
+    randomizer = random.Random(seed)
+    font = defcon.Font()
+    font.info.familyName = "Benchmark"
+    font.info.unitsPerEm = 1000
+    font.info.ascender = 750
+    font.info.descender = -250
+
+    glyphNames = []
+    for index in range(glyphCount):
+        if index < len(encodedCharacters):
+            uni = ord(encodedCharacters[index])
+            glyphName = "uni%04X" % uni
+            unicodes = [uni]
+        else:
+            glyphName = "glyph%05d" % index
+            unicodes = []
+        glyph = font.newGlyph(glyphName)
+        glyph.unicodes = unicodes
+        glyph.width = randomizer.randint(200, 800)
+        pen = glyph.getPen()
+        pen.moveTo((50, 0))
+        pen.lineTo((50, 500))
+        pen.lineTo((glyph.width - 50, 500))
+        pen.lineTo((glyph.width - 50, 0))
+        pen.closePath()
+        glyphNames.append(glyphName)
+    glyph = font.newGlyph(".notdef")
+    glyph.width = 500
+    font.glyphOrder = [".notdef"] + glyphNames
+
+    # kerning, half class based
+    classCount = max(1, min(200, glyphCount // 20))
+    kerningClasses = []
+    for index in range(classCount):
+        members = glyphNames[index * 10:index * 10 + 10]
+        if not members:
+            break
+        font.groups["public.kern1.k%d" % index] = members
+        font.groups["public.kern2.k%d" % index] = members
+        kerningClasses.append(index)
+    kerning = {}
+    while len(kerning) < kerningPairCount:
+        if kerningClasses and randomizer.random() < .5:
+            first = "public.kern1.k%d" % randomizer.choice(kerningClasses)
+            second = "public.kern2.k%d" % randomizer.choice(kerningClasses)
+        else:
+            first = randomizer.choice(glyphNames)
+            second = randomizer.choice(glyphNames)
+        kerning[first, second] = randomizer.randint(-100, 100)
+    font.kerning.update(kerning)
+
+    # features
+    fea = []
+    alternates = glyphNames[len(glyphNames) // 2:]
+    bases = glyphNames[:len(alternates)]
+    if alternates:
+        fea.append("@bases = [%s];" % " ".join(bases[:500]))
+        fea.append("@alternates = [%s];" % " ".join(alternates[:500]))
+        fea.append("feature salt {\n    sub @bases by @alternates;\n} salt;")
+        fea.append("feature ss01 {\n    sub %s by %s;\n} ss01;" % (bases[0], alternates[0]))
+    if contextualRuleCount:
+        classSize = 20
+        for index in range(contextualRuleCount):
+            left = randomizer.sample(glyphNames, min(classSize, len(glyphNames)))
+            fea.append("@left%d = [%s];" % (index, " ".join(left)))
+        fea.append("lookup contextualSingle {\n    sub @bases by @alternates;\n} contextualSingle;")
+        rules = ["    sub @left%d @bases' lookup contextualSingle;" % index for index in range(contextualRuleCount)]
+        fea.append("feature calt {\n%s\n} calt;" % "\n".join(rules))
+    font.features.text = "\n\n".join(fea)
+    font.save(path)
+    return path
+
+
+def writeBinarySource(featureFont, path):
+    # a binary with glyph names, for BinaryFeatureFont
+    source = TTFont(io.BytesIO(featureFont._data))
+    source.setGlyphOrder(featureFont.source.getGlyphOrder())
+    FontBuilder(font=source).setupPost()
+    # the builder only keeps glyph names for fonts with outlines
+    post = source["post"]
+    post.formatType = 2.0
+    post.extraNames = []
+    post.mapping = {}
+    source.save(path)
+    return path
+
+
+def timeit(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return dict(min=min(times), median=statistics.median(times), runs=len(times))
+
+
+def clearCaches():
+    # all class level caches shared between fonts, the per font caches go with a freshly opened font
+    FeatureFont.kernFeatureCache.clear()
+    FeatureFont.tableCache.clear()
+    FeatureFont._statementFeaCache.clear()
+    BinaryFeatureFont.binarySources.clear()
+    with GlyphMetrics._glifCacheLock:
+        GlyphMetrics._glifCache.clear()
+
+
+def checkKernFeatureCompile(font):
+    """
+    Compare the shaping of the direct kern feature compile with
+    compiling the serialized feature text.
+    """
+    texts = [shortText, paragraphText] + ["".join(random.Random(index).sample(encodedCharacters[:200], 12)) for index in range(50)]
+    return not compareKernFeatureCompile(font, [(text, dict()) for text in texts])
+
+
+def benchmarkScale(scale, directory, repeat):
+    results = []
+
+    def add(name, timing):
+        timing.update(scale=scale["name"], name=name)
+        results.append(timing)
+        print("%-8s %-40s min %9.4fs  median %9.4fs" % (scale["name"], name, timing["min"], timing["median"]))
+
+    path = os.path.join(directory, "%s.ufo" % scale["name"])
+    makeSyntheticFont(path, scale["glyphCount"], scale["kerningPairCount"], scale["contextualRuleCount"])
+
+    def openFont():
+        return defcon.Font(path)
+
+    # construction from a freshly opened UFO, without any caches
+    def construct():
+        clearCaches()
+        FeatureFont(openFont())
+    add("FeatureFont()", timeit(construct, repeat))
+
+    font = openFont()
+    featureFont = FeatureFont(font)
+
+    # construction with warm in memory caches
+    add("FeatureFont() warm", timeit(lambda: FeatureFont(font), repeat))
+
+    def getFeatureText():
+        FeatureFont.kernFeatureCache.clear()
+        featureFont._getFeatureText(font)
+    add("_getFeatureText()", timeit(getFeatureText, repeat))
+
+    def process(text):
+        featureFont.shapeCache.clear()
+        featureFont.process(text)
+    add("process() short", timeit(lambda: process(shortText), repeat * 10))
+    add("process() paragraph", timeit(lambda: process(paragraphText), repeat * 10))
+
+    # binary path
+    binaryPath = writeBinarySource(featureFont, os.path.join(directory, "%s.ttf" % scale["name"]))
+    font.lib["com.typemytype.robofont.binarySource"] = binaryPath
+
+    def constructBinary():
+        BinaryFeatureFont.binarySources.clear()
+        BinaryFeatureFont(font)
+    add("BinaryFeatureFont()", timeit(constructBinary, repeat))
+    binaryFeatureFont = BinaryFeatureFont(font)
+
+    def processBinary(text):
+        binaryFeatureFont.shapeCache.clear()
+        binaryFeatureFont.process(text)
+    add("BinaryFeatureFont.process() paragraph", timeit(lambda: processBinary(paragraphText), repeat * 10))
+    del font.lib["com.typemytype.robofont.binarySource"]
+
+    if scale["kerningPairCount"]:
+        equal = checkKernFeatureCompile(font)
+        print("%-8s %-40s %s" % (scale["name"], "kern feature compile check", "ok" if equal else "FAILED"))
+        results.append(dict(scale=scale["name"], name="kern feature compile check", ok=equal))
+    return results
+
+
+def runBenchmarks(scaleNames=None, repeat=3):
+    # never read or write the persistent compile cache while benchmarking
+    FeatureFont.compileCache = None
+    directory = tempfile.mkdtemp(prefix="featurePreviewBenchmark")
+    results = []
+    try:
+        for scale in scales:
+            if scaleNames and scale["name"] not in scaleNames:
+                continue
+            results.extend(benchmarkScale(scale, directory, repeat))
+    finally:
+        shutil.rmtree(directory)
+    return dict(
+        meta=dict(
+            date=time.strftime("%Y-%m-%d %H:%M:%S"),
+            python=platform.python_version(),
+            platform=platform.platform(),
+            fontTools=fontTools.version,
+            repeat=repeat,
+        ),
+        results=results
+    )
+
+
+def compareResults(beforePath, afterPath):
+    with open(beforePath) as f:
+        before = json.load(f)
+    with open(afterPath) as f:
+        after = json.load(f)
+    beforeTimings = {(result["scale"], result["name"]): result for result in before["results"] if "min" in result}
+    for result in after["results"]:
+        if "min" not in result:
+            continue
+        key = result["scale"], result["name"]
+        if key not in beforeTimings:
+            continue
+        old = beforeTimings[key]["min"]
+        new = result["min"]
+        ratio = new / old if old else float("inf")
+        print("%-8s %-40s %9.4fs -> %9.4fs  x%.2f" % (key[0], key[1], old, new, ratio))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Benchmark FeatureFont on synthetic UFOs.")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    parser.add_argument("--scale", action="append", choices=[scale["name"] for scale in scales], help="only run these scales")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two JSON result files")
+    args = parser.parse_args(args)
+    if args.compare:
+        compareResults(*args.compare)
+        return
+    results = runBenchmarks(args.scale, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+Check that compiling the generated kern feature directly from the feature
+file gives the same shaping as compiling its serialized feature text.
+
+Synthetic UFOs with group heavy kerning and many exceptions are shaped
+with `process()` by both compiles and every glyph record is compared:
+
+    python benchmarks/kernFeatureCheck.py --fonts 5 --inputs 500
+"""
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source", "lib"))
+
+import defcon
+
+from featureFont import FeatureFont
+
+
+latinCharacters = [chr(uni) for uni in list(range(0x41, 0x5B)) + list(range(0x61, 0x7B)) + list(range(0xC0, 0x180))]
+arabicCharacters = [chr(uni) for uni in range(0x0627, 0x064B)]
+markCharacters = [chr(uni) for uni in range(0x0300, 0x0310)]
+
+
+def makeKerningFont(seed=0, groupSize=4, pairCount=3000, exceptionRatio=.4):
+    """
+    Return a UFO with Latin, Arabic and mark glyphs, kerning groups over
+    most glyphs, class pairs and glyph/class, class/glyph and glyph/glyph
+    exceptions to those class pairs.
+    """
+    randomizer = random.Random(seed)
+    font = defcon.Font()
+    font.info.unitsPerEm = 1000
+    font.info.ascender = 750
+    font.info.descender = -250
+    glyph = font.newGlyph(".notdef")
+    glyph.width = 500
+    glyphNames = []
+    for characters, width in ((latinCharacters, (300, 700)), (arabicCharacters, (200, 600)), (markCharacters, (0, 0))):
+        for character in characters:
+            glyphName = "uni%04X" % ord(character)
+            glyph = font.newGlyph(glyphName)
+            glyph.unicodes = [ord(character)]
+            glyph.width = randomizer.randint(*width)
+            glyphNames.append(glyphName)
+    font.glyphOrder = [".notdef"] + glyphNames
+    font.lib["public.openTypeCategories"] = {"uni%04X" % ord(character): "mark" for character in markCharacters}
+
+    # groups per script, a glyph is in at most one group per side
+    groups = {1: [], 2: []}
+    for characters in (latinCharacters, arabicCharacters, markCharacters):
+        names = ["uni%04X" % ord(character) for character in characters]
+        for side in (1, 2):
+            shuffled = list(names)
+            randomizer.shuffle(shuffled)
+            for index in range(0, len(shuffled) - groupSize, groupSize):
+                groupName = "public.kern%d.%s%d" % (side, names[0], index)
+                font.groups[groupName] = shuffled[index:index + groupSize]
+                groups[side].append(groupName)
+
+    def members(name):
+        return font.groups.get(name, [name])
+
+    kerning = {}
+    while len(kerning) < pairCount * (1 - exceptionRatio):
+        kerning[randomizer.choice(groups[1]), randomizer.choice(groups[2])] = randomizer.randint(-150, 100)
+    classPairs = list(kerning)
+    while len(kerning) < pairCount:
+        first, second = randomizer.choice(classPairs)
+        kind = randomizer.choice(["glyphClass", "classGlyph", "glyphGlyph"])
+        if kind in ("glyphClass", "glyphGlyph"):
+            first = randomizer.choice(members(first))
+        if kind in ("classGlyph", "glyphGlyph"):
+            second = randomizer.choice(members(second))
+        # zero value exceptions switch off a class pair
+        kerning[first, second] = randomizer.choice([0, randomizer.randint(-150, 100)])
+    font.kerning.update(kerning)
+    font.features.text = ""
+    return font, glyphNames
+
+
+def recordSignature(featureFont, stringOrGlyphList, **kwargs):
+    return [
+        (glyphRecord.glyph.name, glyphRecord.xPlacement, glyphRecord.yPlacement, glyphRecord.xAdvance, glyphRecord.yAdvance)
+        for glyphRecord in featureFont.process(stringOrGlyphList, **kwargs)
+    ]
+
+
+def compareKernFeatureCompile(font, inputs):
+    """
+    Return a list of (input, direct records, text records) for the inputs
+    that shape differently with the direct kern feature compile.
+    """
+    compileCache = FeatureFont.compileCache
+    FeatureFont.compileCache = None
+    try:
+        FeatureFont.kernFeatureCache.clear()
+        FeatureFont.tableCache.clear()
+        featureFont = FeatureFont(font)
+        textFeatureFont = FeatureFont(font)
+        featureText = textFeatureFont._getFeatureText(font)
+        textFeatureFont._getFeatureFile = lambda font: featureText
+        # compile the serialized feature text without reusing any table
+        FeatureFont.kernFeatureCache.clear()
+        FeatureFont.tableCache.clear()
+        textFeatureFont.buildBinaryFont()
+    finally:
+        FeatureFont.compileCache = compileCache
+    differences = []
+    for stringOrGlyphList, kwargs in inputs:
+        records = recordSignature(featureFont, stringOrGlyphList, **kwargs)
+        textRecords = recordSignature(textFeatureFont, stringOrGlyphList, **kwargs)
+        if records != textRecords:
+            differences.append((stringOrGlyphList, records, textRecords))
+    return differences
+
+
+def makeInputs(font, glyphNames, count, seed=0):
+    randomizer = random.Random(seed)
+    latin = [name for name in glyphNames if font[name].unicodes[0] < 0x0300]
+    arabic = [name for name in glyphNames if 0x0600 <= font[name].unicodes[0] < 0x0700]
+    marks = [name for name in glyphNames if 0x0300 <= font[name].unicodes[0] < 0x0370]
+    inputs = []
+    for _ in range(count):
+        # glyph lists with marks between the pairs
+        glyphList = []
+        for _ in range(randomizer.randint(2, 12)):
+            glyphList.append(randomizer.choice(latin))
+            if randomizer.random() < .2:
+                glyphList.append(randomizer.choice(marks))
+        inputs.append((glyphList, dict()))
+        inputs.append((randomizer.sample(arabic, 6), dict(script="arab", rightToLeft=True)))
+        inputs.append(("".join(chr(font[name].unicodes[0]) for name in randomizer.sample(latin, 8)), dict()))
+    return inputs
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Compare the direct kern feature compile with the feature text round trip.")
+    parser.add_argument("--fonts", type=int, default=3, help="number of synthetic fonts")
+    parser.add_argument("--inputs", type=int, default=300, help="number of inputs per font and kind")
+    args = parser.parse_args(args)
+    failed = False
+    for seed in range(args.fonts):
+        font, glyphNames = makeKerningFont(seed)
+        inputs = makeInputs(font, glyphNames, args.inputs, seed)
+        differences = compareKernFeatureCompile(font, inputs)
+        print("font %d: %d kerning pairs, %d groups, %d inputs, %d differences" % (seed, len(font.kerning), len(font.groups), len(inputs), len(differences)))
+        for stringOrGlyphList, records, textRecords in differences[:5]:
+            print("    %r\n        %r\n        %r" % (stringOrGlyphList, records, textRecords))
+        failed = failed or bool(differences)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+import threading
+import weakref
+
+from fontTools import unicodedata
+
+
+# add all glyphs, even the un encoded ones at a high unicode...
+# see https://github.com/harfbuzz/uharfbuzz/issues/22
+unencodedOffset = 0x110000
+
+caseConversions = ("upper", "lower", "title")
+
+
+class CharacterMap(object):
+
+    """
+    A cmap and reverse cmap for the default layer of a defcon font.
+
+    The maps are kept up to date with glyph notifications instead of
+    rescanning all glyphs. Unencoded glyphs get a private codepoint above
+    0x10FFFF, once assigned a glyph name keeps its private codepoint.
+
+    The scripts of the encoded codepoints are counted along, and the upper,
+    lower and title case conversions are kept as glyph name maps. A case
+    conversion is looked up once per glyph and dropped again when one of
+    the codepoints it depends on changes.
+
+    Use `CharacterMap.forFont(font)` to get the shared map for a font.
+    """
+
+    _characterMaps = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def forFont(cls, font):
+        characterMap = cls._characterMaps.get(font)
+        if characterMap is None:
+            characterMap = cls._characterMaps[font] = cls(font)
+        return characterMap
+
+    def __init__(self, font):
+        self._lock = threading.RLock()
+        self._font = weakref.ref(font)
+        self._layer = weakref.ref(font.layers.defaultLayer)
+        self._privateCodepoints = dict()
+        self._nextPrivateCodepoint = unencodedOffset
+        # increments on every change
+        self.changeCount = 0
+        self.rebuild()
+
+        dispatcher = font.dispatcher
+        dispatcher.addObserver(self, "_glyphUnicodesChanged", "Glyph.UnicodesChanged")
+        layer = self._layer()
+        layer.addObserver(self, "_glyphAdded", "Layer.GlyphAdded")
+        layer.addObserver(self, "_glyphDeleted", "Layer.GlyphDeleted")
+        layer.addObserver(self, "_glyphNameChanged", "Layer.GlyphNameChanged")
+        font.addObserver(self, "_glyphsReloaded", "Font.ReloadedGlyphs")
+
+    def rebuild(self):
+        with self._lock:
+            font = self._font()
+            layer = self._layer()
+            self.cmap = dict()
+            self.reverseCMAP = dict()
+            self._codepointNames = dict()
+            self._glyphUnicodes = dict()
+            # script -> number of encoded codepoints
+            self._scriptCounts = dict()
+            # frozenset of script extensions -> number of encoded codepoints
+            self._scriptExtensionCounts = dict()
+            # case -> {glyphName: converted glyph names, None for a missing glyph}
+            self._caseMaps = {case: dict() for case in caseConversions}
+            # case -> {codepoint: glyph names with a conversion using the codepoint}
+            self._caseDependencies = {case: dict() for case in caseConversions}
+            for uni, names in layer.unicodeData.items():
+                self._codepointNames[uni] = list(names)
+                self.cmap[uni] = names[0]
+                for name in names:
+                    self._glyphUnicodes.setdefault(name, []).append(uni)
+            # keep the private codepoints in glyph order
+            glyphNames = [name for name in font.glyphOrder if name in layer]
+            glyphNames += sorted(set(layer.keys()) - set(glyphNames))
+            for name in glyphNames:
+                if name not in self._glyphUnicodes:
+                    self._glyphUnicodes[name] = []
+                    self._addUnencoded(name)
+            for uni in sorted(self.cmap):
+                self.reverseCMAP.setdefault(self.cmap[uni], uni)
+                if uni < unencodedOffset:
+                    self._countScripts(uni, 1)
+            self.changeCount += 1
+
+    def snapshot(self):
+        """
+        Return a copy of the cmap, the reverse cmap, the scripts and the
+        script extension sets of the encoded codepoints.
+        """
+        with self._lock:
+            scripts = set(script for script, count in self._scriptCounts.items() if count)
+            scriptExtensions = set(extensions for extensions, count in self._scriptExtensionCounts.items() if count)
+            return dict(self.cmap), dict(self.reverseCMAP), scripts, scriptExtensions
+
+    def convertCase(self, case, glyphNames, fallbackGlyph=".notdef"):
+        """
+        Return the glyph names converted to "upper", "lower" or "title" case.
+        Characters without a glyph become the fallback glyph, or are
+        skipped when the fallback glyph is None.
+        """
+        with self._lock:
+            caseMap = self._caseMaps[case]
+            converted = []
+            for glyphName in glyphNames:
+                names = caseMap.get(glyphName)
+                if names is None:
+                    names = self._getCaseConversion(case, glyphName)
+                for name in names:
+                    if name is None:
+                        name = fallbackGlyph
+                        if name is None:
+                            continue
+                    converted.append(name)
+            return converted
+
+    # scripts
+
+    def _countScripts(self, uni, count):
+        char = chr(uni)
+        script = unicodedata.script(char)
+        self._scriptCounts[script] = self._scriptCounts.get(script, 0) + count
+        extensions = frozenset(unicodedata.script_extension(char))
+        self._scriptExtensionCounts[extensions] = self._scriptExtensionCounts.get(extensions, 0) + count
+
+    # case conversion
+
+    def _getCaseConversion(self, case, glyphName):
+        uni = self.reverseCMAP.get(glyphName)
+        names = (glyphName, )
+        if uni is not None and uni < unencodedOffset:
+            char = chr(uni)
+            convertedChars = getattr(char, case)()
+            if convertedChars != char:
+                names = tuple(self.cmap.get(ord(c)) for c in convertedChars)
+                dependencies = self._caseDependencies[case]
+                for c in convertedChars:
+                    dependencies.setdefault(ord(c), set()).add(glyphName)
+        self._caseMaps[case][glyphName] = names
+        return names
+
+    def _invalidateCaseConversions(self, uni, oldName, name):
+        for case in caseConversions:
+            caseMap = self._caseMaps[case]
+            caseMap.pop(oldName, None)
+            caseMap.pop(name, None)
+            for glyphName in self._caseDependencies[case].pop(uni, ()):
+                caseMap.pop(glyphName, None)
+
+    # private codepoints
+
+    def _addUnencoded(self, name):
+        uni = self._privateCodepoints.get(name)
+        if uni is None:
+            uni = self._privateCodepoints[name] = self._nextPrivateCodepoint
+            self._nextPrivateCodepoint += 1
+        self._setCodepoint(uni, name)
+
+    def _removeUnencoded(self, name):
+        uni = self._privateCodepoints.get(name)
+        if uni is not None:
+            self._setCodepoint(uni, None)
+
+    # updating
+
+    def _setCodepoint(self, uni, name):
+        oldName = self.cmap.get(uni)
+        if oldName == name:
+            return
+        if oldName is not None:
+            del self.cmap[uni]
+            if self.reverseCMAP.get(oldName) == uni:
+                del self.reverseCMAP[oldName]
+                # fall back to an other codepoint of the glyph
+                others = [other for other in self._glyphUnicodes.get(oldName, []) if self.cmap.get(other) == oldName]
+                if others:
+                    self.reverseCMAP[oldName] = min(others)
+        if name is not None:
+            self.cmap[uni] = name
+            if name not in self.reverseCMAP or uni < self.reverseCMAP[name]:
+                self.reverseCMAP[name] = uni
+        if uni < unencodedOffset:
+            if oldName is None:
+                self._countScripts(uni, 1)
+            elif name is None:
+                self._countScripts(uni, -1)
+        self._invalidateCaseConversions(uni, oldName, name)
+        self.changeCount += 1
+
+    def _updateCodepoint(self, uni):
+        names = self._codepointNames.get(uni)
+        if names:
+            self._setCodepoint(uni, names[0])
+        else:
+            self._codepointNames.pop(uni, None)
+            self._setCodepoint(uni, None)
+
+    def _setGlyphUnicodes(self, name, unicodes):
+        oldUnicodes = self._glyphUnicodes.get(name, [])
+        unicodes = list(unicodes)
+        for uni in oldUnicodes:
+            if uni not in unicodes:
+                names = self._codepointNames.get(uni, [])
+                if name in names:
+                    names.remove(name)
+        for uni in unicodes:
+            if uni not in oldUnicodes:
+                self._codepointNames.setdefault(uni, []).append(name)
+        self._glyphUnicodes[name] = unicodes
+        for uni in set(oldUnicodes) | set(unicodes):
+            self._updateCodepoint(uni)
+        if unicodes:
+            self._removeUnencoded(name)
+        else:
+            self._addUnencoded(name)
+
+    def _removeGlyph(self, name):
+        unicodes = self._glyphUnicodes.pop(name, [])
+        for uni in unicodes:
+            names = self._codepointNames.get(uni, [])
+            if name in names:
+                names.remove(name)
+        for uni in unicodes:
+            self._updateCodepoint(uni)
+        self._removeUnencoded(name)
+
+    # notifications
+
+    def _glyphUnicodesChanged(self, notification):
+        glyph = notification.object
+        if glyph.layer is not self._layer():
+            return
+        with self._lock:
+            if glyph.name in self._glyphUnicodes:
+                self._setGlyphUnicodes(glyph.name, notification.data["newValue"])
+
+    def _glyphAdded(self, notification):
+        name = notification.data["name"]
+        with self._lock:
+            self._glyphUnicodes.setdefault(name, [])
+            self._setGlyphUnicodes(name, self._layer()[name].unicodes)
+
+    def _glyphDeleted(self, notification):
+        name = notification.data["name"]
+        with self._lock:
+            self._removeGlyph(name)
+
+    def _glyphNameChanged(self, notification):
+        oldName = notification.data["oldValue"]
+        newName = notification.data["newValue"]
+        with self._lock:
+            unicodes = self._glyphUnicodes.get(oldName, [])
+            self._removeGlyph(oldName)
+            # the private codepoint moves with the glyph
+            if oldName in self._privateCodepoints and newName not in self._privateCodepoints:
+                self._privateCodepoints[newName] = self._privateCodepoints.pop(oldName)
+            self._glyphUnicodes[newName] = []
+            self._setGlyphUnicodes(newName, unicodes)
+
+    def _glyphsReloaded(self, notification):
+        self.rebuild()
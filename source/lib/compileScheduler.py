@@ -0,0 +1,99 @@
+import threading
+import traceback
+
+from featureFont import FeatureFont, CompileCancelled
+
+
+class CompileScheduler(object):
+
+    """
+    Compile FeatureFont objects on a worker thread.
+
+    Starting a new compile cancels and supersedes the running one,
+    only the result of the latest compile is send to the callback.
+    `scheduleCompile` debounces a burst of calls into a single compile.
+
+    The callback is called from the worker thread with `featureFont, error`,
+    where `error` is a formatted traceback or None.
+    """
+
+    def __init__(self, font, featureFontClass=FeatureFont, callback=None, delay=0.5):
+        self.font = font
+        self.featureFontClass = featureFontClass
+        self.callback = callback
+        self.delay = delay
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._cancelEvent = None
+        self._thread = None
+        self._timer = None
+
+    def compile(self):
+        with self._lock:
+            self._cancelTimer()
+            self._cancelCompile()
+            self._startCompile()
+
+    def scheduleCompile(self, delay=None):
+        if delay is None:
+            delay = self.delay
+        with self._lock:
+            self._cancelTimer()
+            # the running compile is outdated
+            self._cancelCompile()
+            self._timer = threading.Timer(delay, self.compile)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self):
+        with self._lock:
+            self._cancelTimer()
+            self._cancelCompile()
+
+    def isCompiling(self):
+        with self._lock:
+            return self._cancelEvent is not None or self._timer is not None
+
+    def wait(self, timeout=None):
+        # block until the pending and running compiles are done
+        timer = self._timer
+        if timer is not None:
+            timer.join(timeout)
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def _cancelTimer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _cancelCompile(self):
+        self._generation += 1
+        if self._cancelEvent is not None:
+            self._cancelEvent.set()
+            self._cancelEvent = None
+
+    def _startCompile(self):
+        cancelEvent = threading.Event()
+        self._cancelEvent = cancelEvent
+        self._thread = threading.Thread(target=self._compile, args=(self._generation, cancelEvent))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _compile(self, generation, cancelEvent):
+        featureFont = None
+        error = None
+        try:
+            featureFont = self.featureFontClass(self.font, cancelEvent=cancelEvent)
+        except CompileCancelled:
+            return
+        except Exception:
+            error = traceback.format_exc()
+        with self._lock:
+            if generation != self._generation:
+                # superseded by a newer compile
+                return
+            self._cancelEvent = None
+        if self.callback is not None:
+            self.callback(featureFont, error)
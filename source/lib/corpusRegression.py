@@ -0,0 +1,222 @@
+"""
+Find the inputs of a corpus that shape differently after a change.
+
+    python corpusRegression.py record font.ufo words.txt --store results.sqlite
+    (edit the features)
+    python corpusRegression.py compare font.ufo words.txt --store results.sqlite --baseline <binary hash>
+
+The results are stored as hashes in a sqlite database, keyed by the hash of
+the compiled binary, the shaping settings and the input. Inputs already shaped
+with the same binary and settings are not shaped again.
+"""
+import sys
+import hashlib
+import sqlite3
+import argparse
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import defcon
+
+from featureFont import FeatureFont, shapeCodepoints, _initShapeWorker, _shapeWorkerChunk
+from featureCache import fingerprint
+
+
+def hashInput(string):
+    return hashlib.blake2b(string.encode("utf-8"), digest_size=16).digest()
+
+
+def hashResult(glyphNames, xPlacements, yPlacements, xAdvances, yAdvances):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update("\0".join(glyphNames).encode("utf-8"))
+    for values in (xPlacements, yPlacements, xAdvances, yAdvances):
+        digest.update(b"\0")
+        digest.update(values.tobytes())
+    return digest.digest()
+
+
+def iterChunks(iterable, chunkSize):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= chunkSize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ResultStore(object):
+
+    """
+    Hashed shaping results in a sqlite database.
+    """
+
+    # keep the number of sql variables in a query below the sqlite limit
+    queryChunkSize = 500
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "binaryHash TEXT, settingsHash TEXT, inputHash BLOB, resultHash BLOB, "
+            "PRIMARY KEY (binaryHash, settingsHash, inputHash)) WITHOUT ROWID"
+        )
+        self.connection.commit()
+
+    def get(self, binaryHash, settingsHash, inputHashes):
+        """
+        Return a dict of inputHash: resultHash for the stored inputs.
+        """
+        results = dict()
+        inputHashes = list(set(inputHashes))
+        for index in range(0, len(inputHashes), self.queryChunkSize):
+            chunk = inputHashes[index:index + self.queryChunkSize]
+            query = "SELECT inputHash, resultHash FROM results WHERE binaryHash = ? AND settingsHash = ? AND inputHash IN (%s)" % ", ".join("?" * len(chunk))
+            results.update(self.connection.execute(query, [binaryHash, settingsHash] + chunk))
+        return results
+
+    def set(self, binaryHash, settingsHash, items):
+        """
+        Store an iterable of (inputHash, resultHash).
+        """
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+            ((binaryHash, settingsHash, inputHash, resultHash) for inputHash, resultHash in items)
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class CorpusRegression(object):
+
+    """
+    Shape a corpus with a FeatureFont and compare the results with a baseline binary.
+
+    The corpus is any iterable of strings and is streamed in chunks, inputs
+    without a stored result are shaped across `workers` processes.
+    """
+
+    def __init__(self, storePath, script="latn", langSys=None, rightToLeft=None, case="unchanged", workers=None, chunkSize=10000, workerChunkSize=500):
+        self.store = ResultStore(storePath)
+        self.script = script
+        self.langSys = langSys
+        self.rightToLeft = rightToLeft
+        self.case = case
+        self.workers = workers
+        self.chunkSize = chunkSize
+        self.workerChunkSize = workerChunkSize
+
+    def getBinaryHash(self, featureFont):
+        return hashlib.sha1(featureFont._data).hexdigest()
+
+    def getSettingsHash(self, featureFont):
+        return fingerprint(self.script, self.langSys, self.rightToLeft, self.case, sorted(featureFont.featureStates.items()))
+
+    def record(self, featureFont, corpus):
+        """
+        Shape and store the corpus, return the binary hash to use as baseline.
+        """
+        for _ in self.iterResultChunks(featureFont, corpus):
+            pass
+        return self.getBinaryHash(featureFont)
+
+    def compare(self, baselineBinaryHash, featureFont, corpus):
+        """
+        Yield the inputs that shape differently than with the baseline binary.
+        Inputs without a baseline result are yielded as well.
+        """
+        settingsHash = self.getSettingsHash(featureFont)
+        for chunk, inputHashes, resultHashes in self.iterResultChunks(featureFont, corpus):
+            baseline = self.store.get(baselineBinaryHash, settingsHash, inputHashes)
+            for string, inputHash, resultHash in zip(chunk, inputHashes, resultHashes):
+                if baseline.get(inputHash) != resultHash:
+                    yield string
+
+    def iterResultChunks(self, featureFont, corpus):
+        """
+        Yield `(inputs, inputHashes, resultHashes)` for each chunk of the corpus,
+        only the inputs without a stored result are shaped.
+        """
+        binaryHash = self.getBinaryHash(featureFont)
+        settingsHash = self.getSettingsHash(featureFont)
+        executor = None
+        if self.workers and self.workers > 1:
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_initShapeWorker, initargs=(featureFont._getShapeWorkerData(), ))
+        try:
+            for chunk in iterChunks(corpus, self.chunkSize):
+                inputHashes = [hashInput(string) for string in chunk]
+                stored = self.store.get(binaryHash, settingsHash, inputHashes)
+                missing = dict()
+                for string, inputHash in zip(chunk, inputHashes):
+                    if inputHash not in stored:
+                        missing[inputHash] = string
+                if missing:
+                    shaped = list(zip(missing.keys(), self._shape(featureFont, list(missing.values()), executor)))
+                    self.store.set(binaryHash, settingsHash, shaped)
+                    stored.update(shaped)
+                yield chunk, inputHashes, [stored[inputHash] for inputHash in inputHashes]
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def _shape(self, featureFont, strings, executor):
+        # return the result hashes for the strings
+        features = featureFont._getShapeFeatures(self.script, self.langSys, self.rightToLeft)
+        codepoints = [featureFont._getCodepoints(string, self.case) if string else [] for string in strings]
+        if executor is None:
+            results = (shapeCodepoints(featureFont._harfbuzzFont, item, self.script, self.langSys, self.rightToLeft, features) for item in codepoints)
+        else:
+            shapeChunk = partial(_shapeWorkerChunk, script=self.script, langSys=self.langSys, rightToLeft=self.rightToLeft, features=features)
+            results = (result for chunk in executor.map(shapeChunk, iterChunks(codepoints, self.workerChunkSize)) for result in chunk)
+        getGlyphName = featureFont.source.getGlyphName
+        resultHashes = []
+        for glyphIndexes, clusters, xPlacements, yPlacements, xAdvances, yAdvances in results:
+            glyphNames = [getGlyphName(glyphIndex) for glyphIndex in glyphIndexes]
+            resultHashes.append(hashResult(glyphNames, xPlacements, yPlacements, xAdvances, yAdvances))
+        return resultHashes
+
+    def close(self):
+        self.store.close()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Shape a corpus and report the inputs that changed since a baseline binary.")
+    parser.add_argument("command", choices=["record", "compare"])
+    parser.add_argument("font", help="a UFO path")
+    parser.add_argument("corpus", help="a text file with an input on each line")
+    parser.add_argument("--store", default="featurePreviewRegression.sqlite", help="the sqlite result store")
+    parser.add_argument("--baseline", help="the binary hash printed by record")
+    parser.add_argument("--script", default="latn")
+    parser.add_argument("--langSys")
+    parser.add_argument("--rightToLeft", action="store_true", default=None)
+    parser.add_argument("--case", default="unchanged")
+    parser.add_argument("--feature", action="append", default=[], help="enable a feature, or disable with tag=0")
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args(args)
+
+    featureFont = FeatureFont(defcon.Font(args.font))
+    for feature in args.feature:
+        tag, _, state = feature.partition("=")
+        featureFont.featureStates[tag] = state not in ("0", "false", "off")
+    regression = CorpusRegression(args.store, script=args.script, langSys=args.langSys, rightToLeft=args.rightToLeft, case=args.case, workers=args.workers)
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = (line.rstrip("\r\n") for line in f)
+        if args.command == "record":
+            print(regression.record(featureFont, corpus))
+        else:
+            if not args.baseline:
+                parser.error("compare needs --baseline")
+            count = 0
+            for string in regression.compare(args.baseline, featureFont, corpus):
+                print(string)
+                count += 1
+            sys.stderr.write("%d inputs changed\n" % count)
+    regression.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import os
+import sys
+import time
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def fingerprint(*items):
+    """
+    Return a hex digest for the repr of all given items.
+    Make sure the items have a stable repr (sort dicts and sets first).
+    """
+    digest = hashlib.sha1()
+    for item in items:
+        digest.update(repr(item).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def statFingerprint(paths):
+    """
+    Return a hex digest of the modification time and size of all files
+    in the given paths, directories are scanned recursively.
+    Missing paths are part of the digest as well.
+    """
+    stats = []
+    todo = list(paths)
+    while todo:
+        path = todo.pop()
+        try:
+            entries = list(os.scandir(path))
+        except NotADirectoryError:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                stats.append((path, None))
+            else:
+                stats.append((path, stat.st_mtime_ns, stat.st_size))
+            continue
+        except OSError:
+            stats.append((path, None))
+            continue
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                todo.append(entry.path)
+            else:
+                stat = entry.stat()
+                stats.append((entry.path, stat.st_mtime_ns, stat.st_size))
+    return fingerprint(sorted(stats, key=lambda stat: stat[0]))
+
+
+class LRUCache(object):
+
+    """
+    A bounded in memory cache, the least recently used items are dropped first.
+    """
+
+    def __init__(self, maxSize=128):
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxSize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def info(self):
+        return dict(hits=self.hits, misses=self.misses, size=len(self._items), maxSize=self.maxSize)
+
+
+def defaultCacheDirectory():
+    if sys.platform == "darwin":
+        root = os.path.expanduser("~/Library/Caches")
+    else:
+        root = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+    return os.path.join(root, "com.typemytype.featurePreview")
+
+
+class CompileCache(object):
+
+    """
+    A content addressed on disk cache of compiled binaries.
+
+    Entries are stored as files named by their key, the modification time
+    of an entry is used as last used time for the LRU eviction.
+    """
+
+    fileExtension = ".ttf"
+
+    def __init__(self, directory=None, maxSize=256 * 1024 * 1024):
+        if directory is None:
+            directory = defaultCacheDirectory()
+        self.directory = directory
+        self.maxSize = maxSize
+
+    def _entryPath(self, key):
+        return os.path.join(self.directory, key + self.fileExtension)
+
+    def get(self, key):
+        path = self._entryPath(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            # mark as recently used
+            os.utime(path, None)
+        except OSError:
+            pass
+        return data
+
+    def set(self, key, data):
+        os.makedirs(self.directory, exist_ok=True)
+        # write to a temp file first so readers never see a partial entry
+        fileDescriptor, tempPath = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fileDescriptor, "wb") as f:
+                f.write(data)
+            os.replace(tempPath, self._entryPath(key))
+        except OSError:
+            if os.path.exists(tempPath):
+                os.remove(tempPath)
+            raise
+        self.evict()
+
+    def __contains__(self, key):
+        return os.path.exists(self._entryPath(key))
+
+    def entries(self):
+        """
+        Return a list of dicts with `key`, `size` and `lastUsed` for each entry,
+        most recently used first.
+        """
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+        for fileName in os.listdir(self.directory):
+            if not fileName.endswith(self.fileExtension):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, fileName))
+            except OSError:
+                continue
+            entries.append(dict(key=fileName[:-len(self.fileExtension)], size=stat.st_size, lastUsed=stat.st_mtime))
+        entries.sort(key=lambda entry: entry["lastUsed"], reverse=True)
+        return entries
+
+    def size(self):
+        return sum(entry["size"] for entry in self.entries())
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(entry["size"] for entry in entries)
+        while entries and total > self.maxSize:
+            entry = entries.pop()
+            self.remove(entry["key"])
+            total -= entry["size"]
+
+    def remove(self, key):
+        try:
+            os.remove(self._entryPath(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        for entry in self.entries():
+            self.remove(entry["key"])
+
+    def info(self):
+        entries = self.entries()
+        return dict(
+            directory=self.directory,
+            count=len(entries),
+            size=sum(entry["size"] for entry in entries),
+            maxSize=self.maxSize,
+            oldest=time.ctime(entries[-1]["lastUsed"]) if entries else None
+        )
@@ -0,0 +1,161 @@
+class FeatureOutcome(object):
+
+    """
+    A distinct shaping result and the feature states that produce it.
+    """
+
+    __slots__ = ["glyphRun", "states"]
+
+    def __init__(self, glyphRun, states):
+        self.glyphRun = glyphRun
+        self.states = states
+
+
+def _glyphs(coverage):
+    return frozenset(coverage.glyphs) if coverage is not None else frozenset()
+
+
+def _iterLookupRecords(table):
+    # all nested lookup records in a contextual subtable
+    todo = [table]
+    while todo:
+        item = todo.pop()
+        if isinstance(item, list):
+            todo.extend(item)
+        elif hasattr(item, "LookupListIndex") and hasattr(item, "SequenceIndex"):
+            yield item
+        elif hasattr(item, "__dict__"):
+            if hasattr(item, "ensureDecompiled"):
+                item.ensureDecompiled()
+            for key, value in vars(item).items():
+                if key.endswith("Coverage") or key.startswith("ClassDef") or key.endswith("ClassDef"):
+                    continue
+                if isinstance(value, list) or hasattr(value, "__dict__"):
+                    todo.append(value)
+
+
+class FeatureCoverage(object):
+
+    """
+    A glyph coverage index of the GSUB and GPOS lookups of a binary font.
+
+    Lookups are keyed by `(tableTag, lookupIndex)`. For each lookup the index
+    keeps the glyph sets a subtable needs to apply (all of them must be
+    present), the glyphs a substitution can produce and the nested lookups.
+    Unknown subtables count as always applying.
+    """
+
+    def __init__(self, ttFont):
+        # feature tag -> set of lookup keys
+        self.featureLookups = dict()
+        # lookup key -> list of tuples of glyph sets, None for always
+        self.lookupRequirements = dict()
+        self.lookupOutputs = dict()
+        self.lookupNested = dict()
+        for tableTag in ("GSUB", "GPOS"):
+            if tableTag not in ttFont:
+                continue
+            table = ttFont[tableTag].table
+            if table.LookupList is not None:
+                for lookupIndex, lookup in enumerate(table.LookupList.Lookup):
+                    self._indexLookup(tableTag, lookupIndex, lookup)
+            if table.FeatureList is not None:
+                for record in table.FeatureList.FeatureRecord:
+                    lookups = self.featureLookups.setdefault(record.FeatureTag, set())
+                    lookups.update((tableTag, lookupIndex) for lookupIndex in record.Feature.LookupListIndex)
+
+    def _indexLookup(self, tableTag, lookupIndex, lookup):
+        key = tableTag, lookupIndex
+        requirements = []
+        outputs = set()
+        nested = set()
+        for subtable in lookup.SubTable:
+            while hasattr(subtable, "ExtSubTable"):
+                subtable = subtable.ExtSubTable
+            name = subtable.__class__.__name__
+            if name in ("SingleSubst", "MultipleSubst"):
+                requirements.append((frozenset(subtable.mapping), ))
+                for value in subtable.mapping.values():
+                    if isinstance(value, str):
+                        outputs.add(value)
+                    else:
+                        outputs.update(value)
+            elif name == "AlternateSubst":
+                requirements.append((frozenset(subtable.alternates), ))
+                for values in subtable.alternates.values():
+                    outputs.update(values)
+            elif name == "LigatureSubst":
+                requirements.append((frozenset(subtable.ligatures), ))
+                for ligatures in subtable.ligatures.values():
+                    for ligature in ligatures:
+                        outputs.add(ligature.LigGlyph)
+            elif name == "ReverseChainSingleSubst":
+                requirements.append((_glyphs(subtable.Coverage), ))
+                outputs.update(subtable.Substitute)
+            elif name in ("SinglePos", "PairPos", "CursivePos"):
+                requirements.append((_glyphs(subtable.Coverage), ))
+            elif name == "MarkBasePos":
+                requirements.append((_glyphs(subtable.MarkCoverage), _glyphs(subtable.BaseCoverage)))
+            elif name == "MarkLigPos":
+                requirements.append((_glyphs(subtable.MarkCoverage), _glyphs(subtable.LigatureCoverage)))
+            elif name == "MarkMarkPos":
+                requirements.append((_glyphs(subtable.Mark1Coverage), _glyphs(subtable.Mark2Coverage)))
+            elif name in ("ContextSubst", "ChainContextSubst", "ContextPos", "ChainContextPos"):
+                coverage = getattr(subtable, "Coverage", None)
+                if isinstance(coverage, list):
+                    coverage = coverage[0] if coverage else None
+                if coverage is None and getattr(subtable, "InputCoverage", None):
+                    coverage = subtable.InputCoverage[0]
+                requirements.append((_glyphs(coverage), ))
+                nested.update((tableTag, record.LookupListIndex) for record in _iterLookupRecords(subtable))
+            else:
+                requirements = None
+                break
+        self.lookupRequirements[key] = requirements
+        self.lookupOutputs[key] = outputs
+        self.lookupNested[key] = nested
+
+    def touches(self, lookupKey, glyphs):
+        """
+        Return True when the lookup can apply to a sequence with the given glyphs.
+        """
+        requirements = self.lookupRequirements.get(lookupKey)
+        if requirements is None:
+            return True
+        for requirement in requirements:
+            if all(not glyphSet.isdisjoint(glyphs) for glyphSet in requirement):
+                return True
+        return False
+
+    def getTouchingLookups(self, featureTag, glyphs):
+        """
+        Return the lookups of a feature, including the nested ones, that can apply to the glyphs.
+        """
+        touching = set()
+        todo = list(self.featureLookups.get(featureTag, []))
+        while todo:
+            lookupKey = todo.pop()
+            if lookupKey in touching or not self.touches(lookupKey, glyphs):
+                continue
+            touching.add(lookupKey)
+            todo.extend(self.lookupNested.get(lookupKey, []))
+        return frozenset(touching)
+
+    def closure(self, glyphs, featureTags=None):
+        """
+        Return all glyphs that may appear when shaping a sequence of the given
+        glyphs with any combination of the features.
+        """
+        if featureTags is None:
+            featureTags = self.featureLookups.keys()
+        glyphs = set(glyphs)
+        changed = True
+        while changed:
+            changed = False
+            for featureTag in featureTags:
+                for lookupKey in self.getTouchingLookups(featureTag, glyphs):
+                    outputs = self.lookupOutputs.get(lookupKey)
+                    if outputs and not outputs.issubset(glyphs):
+                        glyphs |= outputs
+                        changed = True
+        return glyphs
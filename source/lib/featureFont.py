@@ -0,0 +1,1150 @@
+import os
+import io
+import re
+import time
+import subprocess
+import weakref
+from array import array
+from collections import deque
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+
+from ufo2fdk.makeotfParts import forceAbsoluteIncludesInFeatures, extractFeaturesAndTables
+from ufo2ft.featureWriters.kernFeatureWriter import KernFeatureWriter, ast
+from ufo2ft.util import makeOfficialGlyphOrder, UNICODE_SCRIPT_ALIASES
+
+import uharfbuzz as hb
+import fontTools
+from fontTools import unicodedata
+from fontTools.feaLib.parser import Parser as FeatureParser
+from fontTools.feaLib.builder import Builder as FeatureBuilder, addOpenTypeFeatures
+from fontTools.fontBuilder import FontBuilder
+from fontTools.ttLib import TTFont
+from fontTools.ttLib.tables.DefaultTable import DefaultTable
+
+from featureCache import CompileCache, LRUCache, fingerprint
+from characterMap import CharacterMap, unencodedOffset
+from glyphMetrics import GlyphMetrics
+from featureCoverage import FeatureCoverage, FeatureOutcome
+from instrumentation import Instrumentation
+
+
+includeRE = re.compile(r"include\s*\(\s*([^\)]+?)\s*\)")
+classNameRE = re.compile(r"@([A-Za-z0-9_.\-]+)")
+
+gsubStatementTypes = (
+    ast.SingleSubstStatement,
+    ast.MultipleSubstStatement,
+    ast.AlternateSubstStatement,
+    ast.LigatureSubstStatement,
+    ast.ReverseChainSingleSubstStatement,
+    ast.ChainContextSubstStatement,
+    ast.IgnoreSubstStatement,
+)
+gposStatementTypes = (
+    ast.SinglePosStatement,
+    ast.PairPosStatement,
+    ast.CursivePosStatement,
+    ast.MarkBasePosStatement,
+    ast.MarkLigPosStatement,
+    ast.MarkMarkPosStatement,
+    ast.ChainContextPosStatement,
+    ast.IgnorePosStatement,
+)
+# statements that do not decide the table of a block
+neutralStatementTypes = (
+    ast.Comment,
+    ast.ScriptStatement,
+    ast.LanguageStatement,
+    ast.LookupFlagStatement,
+    ast.SubtableStatement,
+)
+layoutTables = ("GSUB", "GPOS")
+
+
+class CompileCancelled(Exception):
+    pass
+
+
+def emptyShapeResult():
+    return array("I"), array("I"), array("i"), array("i"), array("i"), array("i")
+
+
+def shapeCodepoints(harfbuzzFont, codepoints, script="latn", langSys=None, rightToLeft=None, features=None):
+    """
+    Shape the codepoints with a harfbuzz font and return a tuple of arrays:
+    `(glyphIndexes, clusters, xPlacements, yPlacements, xAdvances, yAdvances)`.
+    """
+    if not codepoints:
+        # harfbuzz has no positions for an empty buffer
+        return emptyShapeResult()
+    buf = hb.Buffer()
+    if script and script != "DFLT":
+        buf.script = script
+    if langSys is not None:
+        buf.language = langSys
+    if rightToLeft is not None:
+        if rightToLeft:
+            buf.direction = "rtl"
+        else:
+            buf.direction = "ltr"
+    buf.add_codepoints(codepoints)
+    buf.guess_segment_properties()
+
+    hb.shape(harfbuzzFont, buf, features)
+
+    infos = buf.glyph_infos
+    positions = buf.glyph_positions
+    return (
+        array("I", [info.codepoint for info in infos]),
+        array("I", [info.cluster for info in infos]),
+        array("i", [pos.x_offset for pos in positions]),
+        array("i", [pos.y_offset for pos in positions]),
+        array("i", [pos.x_advance for pos in positions]),
+        array("i", [pos.y_advance for pos in positions]),
+    )
+
+
+# text segmentation for FeatureFont.processText
+
+commonScripts = set(["Zyyy", "Zinh", "Zzzz"])
+numberBidiTypes = set(["EN", "AN"])
+
+
+def iterScriptRuns(paragraph):
+    """
+    Split a paragraph into runs with one script and direction.
+    Yields `(start, end, script, rightToLeft)` in logical order, the script
+    is a lowercase ISO 15924 code or None when there is no script at all.
+
+    Common and inherited characters join the run they are in, numbers
+    inside a right to left run get a left to right run of their own.
+    """
+    # the paragraph direction is the direction of the first strong character
+    paragraphRightToLeft = False
+    for char in paragraph:
+        bidi = unicodedata.bidirectional(char)
+        if bidi == "L":
+            break
+        if bidi in ("R", "AL"):
+            paragraphRightToLeft = True
+            break
+    start = 0
+    current = None
+    for index, char in enumerate(paragraph):
+        script = unicodedata.script(char)
+        if script in commonScripts:
+            if current is None or not current[1] or unicodedata.bidirectional(char) not in numberBidiTypes:
+                continue
+            key = current[0], False
+        else:
+            key = script.lower(), unicodedata.script_horizontal_direction(script, "LTR") == "RTL"
+        if current is None:
+            # leading common characters belong to the first run
+            current = key
+        elif key != current:
+            yield start, index, current[0], current[1]
+            start = index
+            current = key
+    if paragraph:
+        if current is None:
+            current = None, paragraphRightToLeft
+        yield start, len(paragraph), current[0], current[1]
+
+
+def iterParagraphs(text):
+    # a string or an iterable of lines, like an open text file
+    if isinstance(text, str):
+        text = io.StringIO(text, newline=None)
+    for line in text:
+        yield line.rstrip("\r\n")
+
+
+# process pool workers for FeatureFont.processMany
+
+_shapeWorkerFont = None
+
+
+def _initShapeWorker(data):
+    global _shapeWorkerFont
+    _shapeWorkerFont = hb.Font(hb.Face(data))
+
+
+def _shapeWorkerChunk(chunk, script, langSys, rightToLeft, features):
+    return [shapeCodepoints(_shapeWorkerFont, codepoints, script, langSys, rightToLeft, features) for codepoints in chunk]
+
+
+class GlyphRecord(object):
+
+    def __init__(self, glyph=None, xPlacement=0, yPlacement=0, xAdvance=0, yAdvance=0, alternates=None):
+        self.glyph = glyph
+        self.advanceWidth = 0
+        self.advanceHeight = 0
+        if glyph is not None:
+            self.advanceWidth = glyph.width
+            self.advanceHeight = glyph.height
+        self.xPlacement = xPlacement
+        self.yPlacement = yPlacement
+        self.xAdvance = xAdvance - self.advanceWidth
+        self.yAdvance = yAdvance - self.advanceHeight
+        if alternates is None:
+            alternates = []
+        self.alternates = alternates
+
+
+class GlyphRun(object):
+
+    """
+    A compact shaping result, the glyph indexes, clusters and positions
+    are stored in arrays. Glyph names, glyph objects and alternates are
+    only looked up when asked for.
+
+    Use `glyphRecords()` to get GlyphRecord objects for a GlyphLineView.
+    """
+
+    __slots__ = ["featureFont", "glyphIndexes", "clusters", "xPlacements", "yPlacements", "xAdvances", "yAdvances"]
+
+    def __init__(self, featureFont, glyphIndexes, clusters, xPlacements, yPlacements, xAdvances, yAdvances):
+        self.featureFont = featureFont
+        self.glyphIndexes = glyphIndexes
+        self.clusters = clusters
+        self.xPlacements = xPlacements
+        self.yPlacements = yPlacements
+        self.xAdvances = xAdvances
+        self.yAdvances = yAdvances
+
+    def __len__(self):
+        return len(self.glyphIndexes)
+
+    def glyphName(self, index):
+        return self.featureFont.source.getGlyphName(self.glyphIndexes[index])
+
+    def glyphNames(self):
+        getGlyphName = self.featureFont.source.getGlyphName
+        return [getGlyphName(glyphIndex) for glyphIndex in self.glyphIndexes]
+
+    def glyph(self, index):
+        return self.featureFont.font[self.glyphName(index)]
+
+    def alternates(self, index):
+        return self.featureFont.getAlternates(self.glyphName(index))
+
+    def glyphRecords(self):
+        featureFont = self.featureFont
+        font = featureFont.font
+        for glyphName, xPlacement, yPlacement, xAdvance, yAdvance in zip(self.glyphNames(), self.xPlacements, self.yPlacements, self.xAdvances, self.yAdvances):
+            yield GlyphRecord(
+                font[glyphName],
+                xPlacement,
+                yPlacement,
+                xAdvance,
+                yAdvance,
+                alternates=featureFont.getAlternates(glyphName)
+            )
+
+
+class TextRun(object):
+
+    """
+    A shaped run of a paragraph with one script, language and direction.
+
+    `paragraphIndex` is the index of the paragraph in the text and
+    `paragraph` its text. `start` and `end` are character offsets in the
+    paragraph, the clusters of the glyph run are relative to `start`.
+    """
+
+    __slots__ = ["paragraphIndex", "paragraph", "start", "end", "script", "langSys", "rightToLeft", "glyphRun"]
+
+    def __init__(self, paragraphIndex, paragraph, start, end, script, langSys, rightToLeft, glyphRun):
+        self.paragraphIndex = paragraphIndex
+        self.paragraph = paragraph
+        self.start = start
+        self.end = end
+        self.script = script
+        self.langSys = langSys
+        self.rightToLeft = rightToLeft
+        self.glyphRun = glyphRun
+
+    def __len__(self):
+        return len(self.glyphRun)
+
+    def glyphRecords(self):
+        return self.glyphRun.glyphRecords()
+
+
+class LazyGlyphSet(Mapping):
+
+    """
+    A read only glyph set for the given glyph names, glyphs are loaded on access.
+    """
+
+    def __init__(self, font, glyphOrder):
+        self.font = font
+        self.glyphOrder = glyphOrder
+        self._glyphNames = set(glyphOrder)
+
+    def __getitem__(self, glyphName):
+        if glyphName not in self._glyphNames:
+            raise KeyError(glyphName)
+        return self.font[glyphName]
+
+    def __contains__(self, glyphName):
+        return glyphName in self._glyphNames
+
+    def __iter__(self):
+        return iter(self.glyphOrder)
+
+    def __len__(self):
+        return len(self.glyphOrder)
+
+
+class Table(object):
+
+    def wrapValue(self, attribute, value):
+        def callback():
+            return value
+        setattr(self, attribute, callback)
+
+
+class FeatureFont(object):
+
+    compileCache = CompileCache()
+    # bump this when the compiled output changes for the same input
+    compileCacheVersion = 1
+    kernFeatureCache = LRUCache(maxSize=8)
+    # compiled GSUB and GPOS tables by the fingerprint of their inputs
+    tableCache = LRUCache(maxSize=16)
+    _statementFeaCache = weakref.WeakKeyDictionary()
+    shapeCacheSize = 512
+    shapeFeaturesCacheSize = 64
+    # capture a cProfile profile of the compile in compileStats.profile
+    profileCompile = False
+
+    def __init__(self, font, cancelEvent=None):
+        self.font = font
+        # a threading.Event like object, when set the compile stops at the next stage
+        self.cancelEvent = cancelEvent
+        self.compileGeneration = 0
+        self.shapeCache = LRUCache(maxSize=self.shapeCacheSize)
+        # harfbuzz feature dicts by settings and feature states
+        self._shapeFeatures = LRUCache(maxSize=self.shapeFeaturesCacheSize)
+        # per stage timings of the compile and of all shape calls
+        self.compileStats = Instrumentation()
+        self.shapeStats = Instrumentation()
+        if self.profileCompile:
+            with self.compileStats.profiled():
+                self.compile()
+        else:
+            self.compile()
+        self.featureStates = dict()
+        self.fallbackGlyph = ".notdef"
+
+    def compile(self):
+        self.compileStats.reset()
+        with self.compileStats.stage("buildCMAP"):
+            self.buildCMAP()
+        self.checkCancelled()
+        with self.compileStats.stage("buildBinaryFont"):
+            self.buildBinaryFont()
+        self.checkCancelled()
+
+    def checkCancelled(self):
+        if self.cancelEvent is not None and self.cancelEvent.is_set():
+            raise CompileCancelled()
+
+    def buildCMAP(self):
+        # the character map is kept up to date with glyph notifications
+        self.characterMap = CharacterMap.forFont(self.font)
+        self.cmap, self.reverseCMAP, self.scripts, self.scriptExtensions = self.characterMap.snapshot()
+
+    def buildBinaryFont(self):
+        font = self.font
+        stats = self.compileStats
+        glyphOrder = sorted(set(font.glyphOrder) | set(self.cmap.values()))
+        with stats.stage("metrics"):
+            # read the advances without loading every glyph
+            metrics = GlyphMetrics.forFont(font).getMetrics(glyphOrder)
+            metrics = {gn: (int(round(width)), int(round(height))) for gn, (width, height) in metrics.items()}
+        unitsPerEm = int(round(font.info.unitsPerEm))
+        ascender = int(round(font.info.ascender))
+        descender = int(round(font.info.descender))
+
+        cacheKey = None
+        if self.compileCache is not None:
+            with stats.stage("compileCache.get"):
+                cacheKey = self.getCompileCacheKey(glyphOrder, metrics, unitsPerEm, ascender, descender)
+                data = self.compileCache.get(cacheKey)
+            if data is not None:
+                self.source = TTFont(io.BytesIO(data), lazy=True)
+                # the binary has no post table with glyph names
+                self.source.setGlyphOrder(glyphOrder)
+                self.setBinaryData(data)
+                return
+
+        ff = FontBuilder(unitsPerEm, isTTF=True)
+        ff.setupGlyphOrder(glyphOrder)
+        if self.cmap:
+            ff.setupCharacterMap(self.cmap)
+        with stats.stage("featureFile"):
+            featureFile = self._getFeatureFile(font)
+            if not isinstance(featureFile, ast.FeatureFile):
+                with stats.stage("featureFile.parse"):
+                    featureFile = FeatureParser(io.StringIO(featureFile), glyphOrder).parse()
+        self.checkCancelled()
+        with stats.stage("tableCache.get"):
+            tableKeys = self._getTableKeys(featureFile, glyphOrder)
+            cachedTables = dict()
+            for tag, tableKey in tableKeys.items():
+                cached = self.tableCache.get(tableKey)
+                if cached is not None:
+                    cachedTables[tag] = cached
+        with stats.stage("addOpenTypeFeatures"):
+            # only build the layout tables with changed inputs
+            addOpenTypeFeatures(ff.font, featureFile, tables=FeatureBuilder.supportedTables - set(cachedTables))
+            gdefData = ff.font["GDEF"].compile(ff.font) if "GDEF" in ff.font else None
+            if any(cachedGDEFData != gdefData for _, cachedGDEFData in cachedTables.values()):
+                # the GDEF changed, the cached table could point to other mark glyph sets
+                addOpenTypeFeatures(ff.font, featureFile, tables=set(cachedTables))
+                cachedTables = dict()
+            for tag, (tableData, _) in cachedTables.items():
+                if tableData is not None:
+                    table = ff.font[tag] = DefaultTable(tag)
+                    table.data = tableData
+        self.checkCancelled()
+        with stats.stage("hmtx"):
+            ff.setupHorizontalMetrics(metrics)
+            ff.setupHorizontalHeader(ascent=ascender, descent=descender)
+        with stats.stage("save"):
+            data = io.BytesIO()
+            ff.save(data)
+            data = data.getvalue()
+        if cachedTables:
+            # the reused tables are raw data, decompile them from the binary when asked for
+            self.source = TTFont(io.BytesIO(data), lazy=True)
+            self.source.setGlyphOrder(glyphOrder)
+        else:
+            self.source = ff.font
+        self.setBinaryData(data)
+        with stats.stage("tableCache.set"):
+            reader = TTFont(io.BytesIO(data), lazy=True).reader
+            gdefData = reader["GDEF"] if "GDEF" in reader else None
+            for tag, tableKey in tableKeys.items():
+                if tag not in cachedTables:
+                    tableData = reader[tag] if tag in reader else None
+                    self.tableCache.set(tableKey, (tableData, gdefData))
+        if cacheKey is not None:
+            with stats.stage("compileCache.set"):
+                try:
+                    self.compileCache.set(cacheKey, self._data)
+                except OSError:
+                    # a cache that cannot be written should never break a compile
+                    pass
+
+    def getCompileCacheKey(self, glyphOrder, metrics, unitsPerEm, ascender, descender):
+        font = self.font
+        # the kern writer inputs are part of the generated feature text
+        return fingerprint(
+            self.__class__.__name__,
+            self.compileCacheVersion,
+            fontTools.version,
+            font.features.text,
+            self._getIncludedFeatureFiles(),
+            self._getKernWriterInputs(font),
+            glyphOrder,
+            [metrics[gn] for gn in glyphOrder],
+            unitsPerEm,
+            ascender,
+            descender,
+        )
+
+    def _getKernWriterInputs(self, font):
+        # the font data the kern writer reads, shared by the compile and the kern feature cache keys
+        return (
+            sorted(font.kerning.items()),
+            sorted((groupName, list(glyphNames)) for groupName, glyphNames in font.groups.items()),
+            makeOfficialGlyphOrder(font, font.glyphOrder),
+            sorted(self.cmap.items()),
+            sorted(font.lib.get("public.openTypeCategories", {}).items()),
+        )
+
+    def _getIncludedFeatureFiles(self):
+        # return (path, data) for all (nested) include files
+        font = self.font
+        if font.path is None:
+            return []
+        included = []
+        seen = set()
+        todo = [(font.features.text, os.path.dirname(font.path))]
+        while todo:
+            fea, directory = todo.pop(0)
+            for path in includeRE.findall(fea or ""):
+                path = os.path.normpath(os.path.join(directory, path.strip("\"'")))
+                if path in seen:
+                    continue
+                seen.add(path)
+                try:
+                    with open(path, "r", encoding="utf-8") as f:
+                        data = f.read()
+                except OSError:
+                    data = None
+                included.append((path, data))
+                if data:
+                    todo.append((data, os.path.dirname(path)))
+        return included
+
+    def setBinaryData(self, data):
+        # data is either bytes or a harfbuzz blob
+        self._data = data
+        # keep the harfbuzz face and font alive as long as the binary does not change,
+        # harfbuzz caches the shape plans on the face
+        self._harfbuzzFace = hb.Face(data)
+        self._harfbuzzFont = hb.Font(self._harfbuzzFace)
+        # features, stylistic set names and alternates are loaded when asked for
+        self._metadata = dict()
+        # shaping results of a previous binary are invalid
+        self.compileGeneration += 1
+        self.shapeCache.clear()
+
+    @property
+    def gpos(self):
+        if "gpos" not in self._metadata:
+            with self.compileStats.stage("loadFeatures"):
+                self.loadFeatures()
+        return self._metadata["gpos"]
+
+    @property
+    def gsub(self):
+        if "gsub" not in self._metadata:
+            with self.compileStats.stage("loadFeatures"):
+                self.loadFeatures()
+        return self._metadata["gsub"]
+
+    @property
+    def stylisticSetNames(self):
+        if "stylisticSetNames" not in self._metadata:
+            with self.compileStats.stage("loadStylisticSetNames"):
+                self.loadStylisticSetNames()
+        return self._metadata["stylisticSetNames"]
+
+    @property
+    def alternates(self):
+        if "alternates" not in self._metadata:
+            with self.compileStats.stage("loadAlternates"):
+                self.loadAlternates()
+        return self._metadata["alternates"]
+
+    @property
+    def featureCoverage(self):
+        if "featureCoverage" not in self._metadata:
+            with self.compileStats.stage("loadFeatureCoverage"):
+                self._metadata["featureCoverage"] = FeatureCoverage(self.source)
+        return self._metadata["featureCoverage"]
+
+    def loadFeatures(self):
+        ft = self.source
+        gpos = None
+        if "GPOS" in ft and ft["GPOS"].table.FeatureList is not None:
+            gpos = Table()
+            GPOSFeatureTags = set()
+            GPOSScriptList = set()
+            GPOSLanguageList = set()
+            for record in ft["GPOS"].table.FeatureList.FeatureRecord:
+                GPOSFeatureTags.add(record.FeatureTag)
+            for record in ft["GPOS"].table.ScriptList.ScriptRecord:
+                GPOSScriptList.add(record.ScriptTag)
+                script = record.Script
+                if script.LangSysCount:
+                    for langSysRecord in script.LangSysRecord:
+                        GPOSLanguageList.add(langSysRecord.LangSysTag)
+
+            gpos.wrapValue("getFeatureList", list(sorted(GPOSFeatureTags)))
+            gpos.wrapValue("getScriptList", GPOSScriptList)
+            gpos.wrapValue("getLanguageList", GPOSLanguageList)
+            gpos.getFeatureState = self.getFeatureState
+            gpos.setFeatureState = self.setFeatureState
+
+        gsub = None
+        if "GSUB" in ft and ft["GSUB"].table.FeatureList is not None:
+            gsub = Table()
+            GSUBFeatureTags = set()
+            GSUBScriptList = set()
+            GSUBLanguageList = set()
+            for record in ft["GSUB"].table.FeatureList.FeatureRecord:
+                GSUBFeatureTags.add(record.FeatureTag)
+            for record in ft["GSUB"].table.ScriptList.ScriptRecord:
+                GSUBScriptList.add(record.ScriptTag)
+                script = record.Script
+                if script.LangSysCount:
+                    for langSysRecord in script.LangSysRecord:
+                        GSUBLanguageList.add(langSysRecord.LangSysTag)
+
+            gsub.wrapValue("getFeatureList", list(sorted(GSUBFeatureTags)))
+            gsub.wrapValue("getScriptList", GSUBScriptList)
+            gsub.wrapValue("getLanguageList", GSUBLanguageList)
+            gsub.getFeatureState = self.getFeatureState
+            gsub.setFeatureState = self.setFeatureState
+
+        self._metadata["gpos"] = gpos
+        self._metadata["gsub"] = gsub
+
+    def loadStylisticSetNames(self):
+        ft = self.source
+        stylisticSetNames = self._metadata["stylisticSetNames"] = dict()
+        if "GSUB" in ft and ft["GSUB"].table.FeatureList is not None:
+            # names, indexed by nameID
+            nameIDs = {}
+            if "name" in ft:
+                for nameRecord in ft["name"].names:
+                    nameID = nameRecord.nameID
+                    platformID = nameRecord.platformID
+                    platEncID = nameRecord.platEncID
+                    langID = nameRecord.langID
+                    nameIDs.setdefault(nameID, {})[platformID, platEncID, langID] = nameRecord.toUnicode()
+            for record in ft["GSUB"].table.FeatureList.FeatureRecord:
+                params = record.Feature.FeatureParams
+                if hasattr(params, "UINameID"):
+                    ssNameID = params.UINameID
+                    namePriority = [(ssNameID, 1, 0, 0), (ssNameID, 1, None, None), (ssNameID, 3, 1, 1033), (ssNameID, 3, None, None)]
+                    ssName = self._skimNameIDs(nameIDs, namePriority)
+                    if ssName:
+                        stylisticSetNames[record.FeatureTag] = ssName
+
+    def loadAlternates(self):
+        alternates = self._metadata["alternates"] = {}
+        self._alternatesTuples = {}
+        ft = self.source
+        if "GSUB" in ft:
+            lookup = ft["GSUB"].table.LookupList.Lookup
+            for record in ft["GSUB"].table.FeatureList.FeatureRecord:
+                if record.FeatureTag == "aalt":
+                    for lookupIndex in record.Feature.LookupListIndex:
+                        for subTable in lookup[lookupIndex].SubTable:
+                            if subTable.LookupType == 1:
+                                for key, value in subTable.mapping.items():
+                                    if key not in alternates:
+                                        alternates[key] = set()
+                                    alternates[key].add(value)
+                            elif subTable.LookupType == 3:
+                                for key, values in subTable.alternates.items():
+                                    if key not in alternates:
+                                        alternates[key] = set()
+                                    alternates[key] |= set(values)
+
+    def process(self, stringOrGlyphList, script="latn", langSys=None, rightToLeft=None, case="unchanged", logger=None):
+        if not stringOrGlyphList:
+            return []
+        glyphRun = self.shape(stringOrGlyphList, script=script, langSys=langSys, rightToLeft=rightToLeft, case=case)
+        with self.shapeStats.stage("glyphRecords"):
+            glyphRecords = list(glyphRun.glyphRecords())
+        if logger is not None:
+            self.shapeStats.log(logger)
+        return glyphRecords
+
+    def shape(self, stringOrGlyphList, script="latn", langSys=None, rightToLeft=None, case="unchanged"):
+        """
+        Same as `process` but returns a compact GlyphRun.
+        """
+        if not stringOrGlyphList:
+            return GlyphRun(self, *emptyShapeResult())
+        if not isinstance(stringOrGlyphList, str):
+            stringOrGlyphList = tuple(stringOrGlyphList)
+        key = stringOrGlyphList, script, langSys, rightToLeft, case, frozenset(self.featureStates.items()), self.compileGeneration
+        stats = self.shapeStats
+        # only keep the stages of this call
+        stats.reset()
+        glyphRun = self.shapeCache.get(key)
+        if glyphRun is None:
+            with stats.stage("codepoints"):
+                codepoints = self._getCodepoints(stringOrGlyphList, case)
+            with stats.stage("harfbuzz"):
+                features = self._getShapeFeatures(script, langSys, rightToLeft)
+                glyphRun = GlyphRun(self, *shapeCodepoints(self._harfbuzzFont, codepoints, script, langSys, rightToLeft, features))
+            self.shapeCache.set(key, glyphRun)
+        return glyphRun
+
+    def processMany(self, stringsOrGlyphLists, script="latn", langSys=None, rightToLeft=None, case="unchanged", workers=None, chunkSize=100):
+        """
+        Shape an iterable of strings or glyph lists with the same settings.
+        Yields a GlyphRun for each input, in order.
+
+        With `workers` the shaping is spread over a pool of processes,
+        each process loads the compiled binary once.
+        """
+        if not workers or workers < 2:
+            for stringOrGlyphList in stringsOrGlyphLists:
+                yield self.shape(stringOrGlyphList, script=script, langSys=langSys, rightToLeft=rightToLeft, case=case)
+            return
+        features = self._getShapeFeatures(script, langSys, rightToLeft)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_initShapeWorker, initargs=(self._getShapeWorkerData(), )) as executor:
+            # only keep a few chunks in flight to stream large inputs
+            pending = deque()
+            for chunk in self._iterCodepointChunks(stringsOrGlyphLists, case, chunkSize):
+                pending.append(executor.submit(_shapeWorkerChunk, chunk, script, langSys, rightToLeft, features))
+                if len(pending) >= workers * 2:
+                    for shaped in pending.popleft().result():
+                        yield GlyphRun(self, *shaped)
+            while pending:
+                for shaped in pending.popleft().result():
+                    yield GlyphRun(self, *shaped)
+
+    def processText(self, text, langSys=None, case="unchanged", maxRunLength=1000):
+        """
+        Shape running text, a string or an iterable of lines.
+
+        The text is split into paragraphs and each paragraph into script and
+        direction runs. Each run is shaped on its own with its segment
+        properties and yielded as a TextRun, so only one run is kept in memory.
+        `langSys` is a language tag for all runs or a dict of script: language tag.
+        Runs longer than `maxRunLength` are split at a space.
+        """
+        for paragraphIndex, paragraph in enumerate(iterParagraphs(text)):
+            for start, end, script, rightToLeft in iterScriptRuns(paragraph):
+                if isinstance(langSys, dict):
+                    language = langSys.get(script)
+                else:
+                    language = langSys
+                features = self._getShapeFeatures(script, language, rightToLeft)
+                while start < end:
+                    runEnd = end
+                    if maxRunLength and end - start > maxRunLength:
+                        runEnd = paragraph.rfind(" ", start + 1, start + maxRunLength) + 1 or start + maxRunLength
+                    codepoints = self._getCodepoints(paragraph[start:runEnd], case)
+                    glyphRun = GlyphRun(self, *shapeCodepoints(self._harfbuzzFont, codepoints, script, language, rightToLeft, features))
+                    yield TextRun(paragraphIndex, paragraph, start, runEnd, script, language, rightToLeft, glyphRun)
+                    start = runEnd
+
+    def getRelevantFeatures(self, stringOrGlyphList, features=None, case="unchanged"):
+        """
+        Return the features, by default all features, with lookups that can
+        apply to a glyph that may appear while shaping the input.
+        """
+        coverage = self.featureCoverage
+        if features is None:
+            features = sorted(coverage.featureLookups)
+        glyphs = self._getCoverageGlyphs(stringOrGlyphList, case)
+        return [featureTag for featureTag in features if coverage.getTouchingLookups(featureTag, glyphs)]
+
+    def getFeatureOutcomes(self, stringOrGlyphList, features=None, script="latn", langSys=None, rightToLeft=None, case="unchanged", maxFeatures=16):
+        """
+        Shape the input with every distinct combination of the features,
+        by default all features, and return a list of FeatureOutcome objects:
+        each distinct result with the list of feature states producing it.
+
+        Features that can not apply to the input are left out of the states
+        and keep their current state. Combinations enabling the same lookups
+        are only shaped once.
+        """
+        coverage = self.featureCoverage
+        glyphs = self._getCoverageGlyphs(stringOrGlyphList, case)
+        if features is None:
+            features = sorted(coverage.featureLookups)
+        featureLookups = [(featureTag, coverage.getTouchingLookups(featureTag, glyphs)) for featureTag in features]
+        featureLookups = [(featureTag, lookups) for featureTag, lookups in featureLookups if lookups]
+        if len(featureLookups) > maxFeatures:
+            raise ValueError("%d features apply to the input, more than maxFeatures (%d)" % (len(featureLookups), maxFeatures))
+        # the enabled features per distinct set of lookups
+        combinations = {frozenset(): [()]}
+        for featureTag, lookups in featureLookups:
+            newCombinations = dict()
+            for enabledLookups, enabledFeatures in combinations.items():
+                newCombinations.setdefault(enabledLookups, []).extend(enabledFeatures)
+                newCombinations.setdefault(enabledLookups | lookups, []).extend(enabled + (featureTag, ) for enabled in enabledFeatures)
+            combinations = newCombinations
+
+        relevantFeatures = [featureTag for featureTag, _ in featureLookups]
+        outcomes = dict()
+        featureStates = self.featureStates
+        try:
+            for enabledFeatureLists in combinations.values():
+                self.featureStates = dict(featureStates)
+                self.featureStates.update((featureTag, featureTag in enabledFeatureLists[0]) for featureTag in relevantFeatures)
+                glyphRun = self.shape(stringOrGlyphList, script=script, langSys=langSys, rightToLeft=rightToLeft, case=case)
+                key = tuple(glyphRun.glyphIndexes), glyphRun.xPlacements.tobytes(), glyphRun.yPlacements.tobytes(), glyphRun.xAdvances.tobytes(), glyphRun.yAdvances.tobytes()
+                outcome = outcomes.get(key)
+                if outcome is None:
+                    outcome = outcomes[key] = FeatureOutcome(glyphRun, [])
+                for enabled in enabledFeatureLists:
+                    outcome.states.append({featureTag: featureTag in enabled for featureTag in relevantFeatures})
+        finally:
+            self.featureStates = featureStates
+        return list(outcomes.values())
+
+    def _getCoverageGlyphs(self, stringOrGlyphList, case):
+        # all glyphs that may appear while shaping the input
+        glyphs = set(self.cmap[uni] for uni in self._getCodepoints(stringOrGlyphList, case) if uni in self.cmap)
+        return self.featureCoverage.closure(glyphs)
+
+    def _getShapeWorkerData(self):
+        return self._data
+
+    def _iterCodepointChunks(self, stringsOrGlyphLists, case, chunkSize):
+        chunk = []
+        for stringOrGlyphList in stringsOrGlyphLists:
+            if stringOrGlyphList:
+                chunk.append(self._getCodepoints(stringOrGlyphList, case))
+            else:
+                chunk.append([])
+            if len(chunk) >= chunkSize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _getCodepoints(self, stringOrGlyphList, case):
+        if isinstance(stringOrGlyphList, str):
+            stringOrGlyphList = self.stringToGlyphNames(stringOrGlyphList)
+        if case != "unchanged":
+            stringOrGlyphList = self.characterMap.convertCase(case, stringOrGlyphList, self.fallbackGlyph)
+        return [self.reverseCMAP[c] for c in stringOrGlyphList if c in self.reverseCMAP]
+
+    def getAlternates(self, glyphName):
+        # share one sorted tuple per glyph between all glyph records
+        allAlternates = self.alternates
+        alternates = self._alternatesTuples.get(glyphName)
+        if alternates is None:
+            alternates = self._alternatesTuples[glyphName] = tuple(sorted(allAlternates.get(glyphName, [])))
+        return alternates
+
+    def _getShapeFeatures(self, script, langSys, rightToLeft):
+        featureStates = frozenset(self.featureStates.items())
+        key = script, langSys, rightToLeft, featureStates
+        features = self._shapeFeatures.get(key)
+        if features is None:
+            features = dict(featureStates)
+            # a disabled init, medi or fina must fall back to the harfbuzz default
+            for tag in ["init", "medi", "fina"]:
+                if tag in features and not features[tag]:
+                    del features[tag]
+            self._shapeFeatures.set(key, features)
+        return features
+
+    def stringToGlyphNames(self, string):
+        glyphNames = []
+        for c in string:
+            c = ord(c)
+            if c in self.cmap:
+                glyphNames.append(self.cmap[c])
+            elif self.fallbackGlyph is not None:
+                glyphNames.append(self.fallbackGlyph)
+        return glyphNames
+
+    def setFeatureState(self, featureTag, state):
+        self.featureStates[featureTag] = state
+
+    def getFeatureState(self, featureTag):
+        return self.featureStates.get(featureTag, False)
+
+    def getLanguageList(self):
+        gsub = set()
+        gpos = set()
+        if self.gsub is not None:
+            gsub = self.gsub.getLanguageList()
+        if self.gpos is not None:
+            gpos = self.gpos.getLanguageList()
+        return sorted(gsub | gpos)
+
+    def getScriptList(self):
+        gsub = set()
+        gpos = set()
+        if self.gsub is not None:
+            gsub = self.gsub.getScriptList()
+        if self.gpos is not None:
+            gpos = self.gpos.getScriptList()
+        return sorted(gsub | gpos)
+
+    def _getFeatureText(self, font):
+        featureFile = self._getFeatureFile(font)
+        if isinstance(featureFile, ast.FeatureFile):
+            return featureFile.asFea()
+        return featureFile
+
+    def _getFeatureFile(self, font):
+        # return the feature text, or a parsed feature file when the kern feature is generated
+        if font.path is None:
+            fea = font.features.text
+            featuretags, _ = extractFeaturesAndTables(fea)
+        else:
+            fea = forceAbsoluteIncludesInFeatures(font.features.text, os.path.dirname(font.path))
+            featuretags, _ = extractFeaturesAndTables(fea, scannedFiles=[os.path.join(font.path, "features.fea")])
+        if "kern" not in featuretags:
+            languageSystems = set(script.lower() for script in self.scripts)
+            languageSystems -= set(["common", "zyyy", "zinh", "zzzz"])
+            languageSystems = ["DFLT"] + sorted(languageSystems)
+
+            data = io.StringIO(fea)
+            feaParser = FeatureParser(data, set(font.keys()))
+            with self.compileStats.stage("featureFile.parse"):
+                feaFile = feaParser.parse()
+            existingLanguageSystems = set()
+            DFLTindex = 0
+            # search for existing language systems
+            # and keep the index of the DFLT if existing
+            for index, st in enumerate(feaFile.statements):
+                if isinstance(st, ast.LanguageSystemStatement):
+                    existingLanguageSystems.add(st.script)
+                    if st.script == "DFLT":
+                        DFLTindex = index + 1
+
+            kernFeatureKey = fingerprint(
+                self._getKernWriterInputs(font),
+                languageSystems,
+                sorted(existingLanguageSystems),
+                DFLTindex,
+                # the kern writer reads the GDEF glyph classes
+                [st.asFea() for st in feaFile.statements if isinstance(st, ast.TableBlock) and st.name == "GDEF"],
+            )
+            kernFeature = self.kernFeatureCache.get(kernFeatureKey)
+            if kernFeature is None:
+                with self.compileStats.stage("featureFile.kernWriter"):
+                    kernFeature = self._writeKernFeature(font, feaFile, languageSystems, existingLanguageSystems, DFLTindex)
+                if kernFeature is None:
+                    # the kern feature is inserted in the middle of the existing features
+                    return feaFile
+                self.kernFeatureCache.set(kernFeatureKey, kernFeature)
+            else:
+                head, tail = kernFeature
+                feaFile.statements = head + feaFile.statements + tail
+            return feaFile
+
+        return fea
+
+    def _getTableKeys(self, featureFile, glyphOrder):
+        """
+        Return a fingerprint of the inputs for the GSUB and the GPOS table.
+
+        Glyph class and mark class definitions count for the tables they are
+        used in, statements that are not part of a GSUB or GPOS block count
+        for both.
+        """
+        statements = featureFile.statements
+        texts = [self._getStatementFea(statement) for statement in statements]
+        usedIn = dict()
+        statementTables = [None] * len(statements)
+        blockTables = dict()
+        # definitions are always before they are used, walk backwards to collect the usage first
+        for index in reversed(range(len(statements))):
+            statement = statements[index]
+            if isinstance(statement, ast.Comment):
+                tables = set()
+            elif isinstance(statement, ast.GlyphClassDefinition):
+                tables = usedIn.get(statement.name, set())
+            elif isinstance(statement, ast.MarkClassDefinition):
+                tables = usedIn.get(statement.markClass.name, set())
+            elif isinstance(statement, (ast.Block, ast.LookupReferenceStatement)):
+                tables = self._getStatementTables(statement, blockTables)
+            else:
+                tables = set(layoutTables)
+            statementTables[index] = tables
+            for name in classNameRE.findall(texts[index]):
+                usedIn.setdefault(name, set()).update(tables)
+
+        tableTexts = {tag: [] for tag in layoutTables}
+        for text, tables in zip(texts, statementTables):
+            for tag in tables:
+                tableTexts[tag].append(text)
+        return {tag: fingerprint(tag, fontTools.version, glyphOrder, tableTexts[tag]) for tag in layoutTables}
+
+    def _getStatementFea(self, statement):
+        # the generated kern statements are reused between compiles, keep their text
+        text = self._statementFeaCache.get(statement)
+        if text is None:
+            text = statement.asFea()
+            self._statementFeaCache[statement] = text
+        return text
+
+    def _getStatementTables(self, statement, blockTables):
+        if isinstance(statement, gsubStatementTypes):
+            return {"GSUB"}
+        if isinstance(statement, gposStatementTypes):
+            return {"GPOS"}
+        if isinstance(statement, neutralStatementTypes):
+            return set()
+        if isinstance(statement, ast.LookupReferenceStatement):
+            return self._getStatementTables(statement.lookup, blockTables)
+        if isinstance(statement, ast.Block):
+            tables = blockTables.get(id(statement))
+            if tables is None:
+                tables = set()
+                for child in statement.statements:
+                    tables |= self._getStatementTables(child, blockTables)
+                blockTables[id(statement)] = tables
+            return tables
+        return set(layoutTables)
+
+    def _writeKernFeature(self, font, feaFile, languageSystems, existingLanguageSystems, DFLTindex):
+        # add the generated kern feature to the feaFile
+        # and return the statements added before and after the existing features
+        existingStatements = set(id(statement) for statement in feaFile.statements)
+        addedStatement = []
+        for script in reversed(languageSystems):
+            if script not in existingLanguageSystems:
+                statement = ast.LanguageSystemStatement(script=script, language="dflt")
+                addedStatement.append(statement)
+                feaFile.statements.insert(DFLTindex, statement)
+        writer = KernFeatureWriter()
+
+        def _kernFeatureWriterSetOrderedGlyphSet():
+            """Return a glyph set sorted by glyphOrder, glyphs are only loaded when asked for."""
+            glyphOrder = makeOfficialGlyphOrder(font, font.glyphOrder)
+            return LazyGlyphSet(font, glyphOrder)
+
+        def _kernFeatureWriterMakeUnicodeToGlyphNameMapping():
+            return {uni: glyphName for uni, glyphName in self.cmap.items() if uni < unencodedOffset}
+
+        def _kernFeatureWriterGuessFontScripts():
+            # same as the writer, but from the script extensions of the character map instead of iterating over all glyphs
+            scripts = set()
+            for extensions in self.scriptExtensions:
+                uniScripts = {UNICODE_SCRIPT_ALIASES.get(script, script) for script in extensions}
+                if len(uniScripts) == 1:
+                    scripts.update(uniScripts)
+            scripts.update(ast.getScriptLanguageSystems(feaFile).keys())
+            return scripts
+
+        writer.getOrderedGlyphSet = _kernFeatureWriterSetOrderedGlyphSet
+        writer.makeUnicodeToGlyphNameMapping = _kernFeatureWriterMakeUnicodeToGlyphNameMapping
+        writer.guessFontScripts = _kernFeatureWriterGuessFontScripts
+        writer.write(font, feaFile)
+
+        # clean up
+        for statement in addedStatement:
+            feaFile.statements.remove(statement)
+
+        def removeScriptlanguage(block):
+            for statement in list(block.statements):
+                if hasattr(statement, "statements"):
+                    removeScriptlanguage(statement)
+                if isinstance(statement, (ast.ScriptStatement, ast.LanguageStatement)):
+                    block.statements.remove(statement)
+
+        for block in ast.iterFeatureBlocks(feaFile, tag="kern"):
+            removeScriptlanguage(block)
+
+        # the writer adds classes at the top and lookups and features at the end
+        isNew = [id(statement) not in existingStatements for statement in feaFile.statements]
+        headCount = isNew.index(False) if False in isNew else len(isNew)
+        tailCount = list(reversed(isNew)).index(False) if False in isNew else 0
+        if sum(isNew) != headCount + tailCount:
+            return None
+        head = feaFile.statements[:headCount]
+        tail = feaFile.statements[len(feaFile.statements) - tailCount:]
+        self._normalizeGlyphClasses(head + tail)
+        return head, tail
+
+    def _normalizeGlyphClasses(self, statements):
+        # the kern writer puts ast.GlyphName objects in glyph classes,
+        # the feaLib builder expects plain glyph names like the parser returns
+        seen = set()
+        todo = list(statements)
+        while todo:
+            element = todo.pop()
+            if id(element) in seen:
+                continue
+            seen.add(id(element))
+            if isinstance(element, ast.GlyphClass):
+                element.glyphs = [glyph.glyph if isinstance(glyph, ast.GlyphName) else glyph for glyph in element.glyphs]
+            for value in vars(element).values():
+                if isinstance(value, ast.Element):
+                    todo.append(value)
+                elif isinstance(value, list):
+                    todo.extend(item for item in value if isinstance(item, ast.Element))
+
+    def _skimNameIDs(self, nameIDs, priority):
+        for (nameID, platformID, platEncID, langID) in priority:
+            for (pID, pEID, lID), text in nameIDs.get(nameID, {}).items():
+                if pID != platformID and platformID is not None:
+                    continue
+                if pEID != platEncID and platEncID is not None:
+                    continue
+                if lID != langID and langID is not None:
+                    continue
+                return text
+
+
+class BinarySource(object):
+
+    """
+    A binary font file, read once.
+
+    The data is read into memory instead of memory mapped: a file rewritten
+    in place (a new export) must never change the data under a lazily
+    parsed font. The same data is shared by harfbuzz and by the lazily
+    parsed fonts of all BinaryFeatureFont objects for the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        start = time.time()
+        startResidentSize = getResidentSize()
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.data = f.read()
+        self.statKey = stat.st_mtime_ns, stat.st_size
+        residentSize = getResidentSize()
+        self.stats = dict(
+            fileSize=len(self.data),
+            openTime=time.time() - start,
+            residentSize=residentSize,
+            # the memory the open added to this process
+            residentSizeChange=residentSize - startResidentSize if None not in (residentSize, startResidentSize) else None
+        )
+
+    def isChanged(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return True
+        return (stat.st_mtime_ns, stat.st_size) != self.statKey
+
+    def getSource(self):
+        """
+        Return a new lazily parsed TTFont over the shared data.
+        """
+        return TTFont(io.BytesIO(self.data), lazy=True)
+
+
+def getResidentSize():
+    # return the current resident memory of this process in bytes, if available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        output = subprocess.check_output(["ps", "-o", "rss=", "-p", str(os.getpid())])
+        # ps reports kilobytes
+        return int(output.strip()) * 1024
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+class BinaryFeatureFont(FeatureFont):
+
+    # the binary is not compiled
+    compileCache = None
+    # shared binary data by path, dropped when no font uses it anymore
+    binarySources = weakref.WeakValueDictionary()
+
+    def buildBinaryFont(self):
+        font = self.font
+        path = font.lib.get("com.typemytype.robofont.binarySource")
+        with self.compileStats.stage("binarySource"):
+            binarySource = self.binarySources.get(path)
+            # reload only when the file is changed
+            if binarySource is None or binarySource.isChanged():
+                self.binarySources.pop(path, None)
+                binarySource = self.binarySources[path] = BinarySource(path)
+        self.binarySource = binarySource
+        self.binaryStats = binarySource.stats
+        # each font gets its own source, the cmap is set per font
+        self.source = binarySource.getSource()
+        ff = FontBuilder(font=self.source)
+        if self.cmap:
+            ff.setupCharacterMap(self.cmap)
+        self.setBinaryData(binarySource.data)
+
+    def reloadIfChanged(self):
+        if self.binarySource.isChanged():
+            self.buildBinaryFont()
+            return True
+        return False
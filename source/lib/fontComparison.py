@@ -0,0 +1,157 @@
+"""
+Compare the shaping of several fonts, like the masters of a designspace
+or the styles of a family.
+
+    python fontComparison.py Light.ufo Regular.ufo Bold.ufo --text "Hamburg" --feature ss01
+    python fontComparison.py family.designspace --textFile words.txt --json
+"""
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import defcon
+
+from featureFont import FeatureFont
+
+
+def expandFontPaths(paths):
+    """
+    Return the UFO paths, the sources of a designspace are expanded.
+    """
+    fontPaths = []
+    for path in paths:
+        if path.endswith(".designspace"):
+            from fontTools.designspaceLib import DesignSpaceDocument
+            document = DesignSpaceDocument.fromfile(path)
+            for source in document.sources:
+                if source.path not in fontPaths:
+                    fontPaths.append(source.path)
+        else:
+            fontPaths.append(os.path.abspath(path))
+    return fontPaths
+
+
+def _compileAndShape(path, inputs, script, langSys, rightToLeft, case, features):
+    # runs in a worker process, the compiled binaries are reused through the compile cache
+    featureFont = FeatureFont(defcon.Font(path))
+    featureFont.featureStates = dict(features or {})
+    # compare the adjustments made by the features, not the advance widths of each font
+    metrics = featureFont.source["hmtx"].metrics
+    results = []
+    for glyphRun in featureFont.processMany(inputs, script=script, langSys=langSys, rightToLeft=rightToLeft, case=case):
+        glyphNames = glyphRun.glyphNames()
+        xAdvances = [xAdvance - metrics[glyphName][0] for glyphName, xAdvance in zip(glyphNames, glyphRun.xAdvances)]
+        positions = list(zip(glyphRun.xPlacements, glyphRun.yPlacements, xAdvances, glyphRun.yAdvances))
+        results.append((glyphNames, positions))
+    return results
+
+
+class FontComparison(object):
+
+    """
+    Compile a set of fonts in parallel, shape the same inputs with the same
+    settings in each font and collect the differences with a reference font,
+    by default the first one.
+    """
+
+    def __init__(self, paths, reference=None, workers=None):
+        self.paths = expandFontPaths(paths)
+        if reference is None:
+            reference = self.paths[0]
+        self.reference = os.path.abspath(reference)
+        if self.reference not in self.paths:
+            self.paths.insert(0, self.reference)
+        self.workers = workers or min(len(self.paths), os.cpu_count() or 1)
+
+    def shape(self, inputs, script="latn", langSys=None, rightToLeft=None, case="unchanged", features=None):
+        """
+        Return a dict of path: list of (glyphNames, positions) for each input,
+        with the x advance as adjustment to the advance width of the glyph.
+        """
+        inputs = list(inputs)
+        arguments = inputs, script, langSys, rightToLeft, case, features
+        if self.workers < 2:
+            return {path: _compileAndShape(path, *arguments) for path in self.paths}
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {path: executor.submit(_compileAndShape, path, *arguments) for path in self.paths}
+            return {path: future.result() for path, future in futures.items()}
+
+    def compare(self, inputs, script="latn", langSys=None, rightToLeft=None, case="unchanged", features=None):
+        """
+        Return a list of differences, a dict for each input and font that shapes
+        differently than the reference font:
+
+            input, font, kind ("glyphs" or "positions"), reference, value
+
+        For "glyphs" reference and value are the glyph names, for "positions"
+        a list of (index, glyphName, referencePosition, position) with
+        positions as (xPlacement, yPlacement, xAdvance, yAdvance). The
+        x advance is the adjustment to the advance width of the glyph in
+        its own font, so different widths between fonts are not reported.
+        """
+        inputs = list(inputs)
+        results = self.shape(inputs, script=script, langSys=langSys, rightToLeft=rightToLeft, case=case, features=features)
+        referenceResults = results[self.reference]
+        differences = []
+        for path in self.paths:
+            if path == self.reference:
+                continue
+            for inputIndex, (referenceResult, result) in enumerate(zip(referenceResults, results[path])):
+                referenceGlyphNames, referencePositions = referenceResult
+                glyphNames, positions = result
+                if glyphNames != referenceGlyphNames:
+                    differences.append(dict(input=inputs[inputIndex], font=path, kind="glyphs", reference=referenceGlyphNames, value=glyphNames))
+                elif positions != referencePositions:
+                    changed = [
+                        (index, glyphName, referencePosition, position)
+                        for index, (glyphName, referencePosition, position) in enumerate(zip(glyphNames, referencePositions, positions))
+                        if referencePosition != position
+                    ]
+                    differences.append(dict(input=inputs[inputIndex], font=path, kind="positions", reference=referencePositions, value=changed))
+        return differences
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Compare the shaping of several UFOs or the sources of a designspace.")
+    parser.add_argument("fonts", nargs="+", help="UFO or designspace paths")
+    parser.add_argument("--reference", help="the font to compare with, default the first font")
+    parser.add_argument("--text", action="append", default=[], help="a string to shape")
+    parser.add_argument("--textFile", help="a file with a string to shape on each line")
+    parser.add_argument("--script", default="latn")
+    parser.add_argument("--langSys")
+    parser.add_argument("--rightToLeft", action="store_true", default=None)
+    parser.add_argument("--case", default="unchanged")
+    parser.add_argument("--feature", action="append", default=[], help="enable a feature, or disable with tag=0")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--json", action="store_true", help="write the differences as JSON")
+    args = parser.parse_args(args)
+
+    inputs = list(args.text)
+    if args.textFile:
+        with open(args.textFile, encoding="utf-8") as f:
+            inputs.extend(line.rstrip("\r\n") for line in f if line.strip())
+    features = dict()
+    for feature in args.feature:
+        tag, _, state = feature.partition("=")
+        features[tag] = state not in ("0", "false", "off")
+
+    comparison = FontComparison(args.fonts, reference=args.reference, workers=args.workers)
+    differences = comparison.compare(inputs, script=args.script, langSys=args.langSys, rightToLeft=args.rightToLeft, case=args.case, features=features)
+    if args.json:
+        json.dump(differences, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    for difference in differences:
+        if difference["kind"] == "glyphs":
+            print("%s  %s\n    %s\n    %s" % (os.path.basename(difference["font"]), difference["input"], " ".join(difference["reference"]), " ".join(difference["value"])))
+        else:
+            print("%s  %s" % (os.path.basename(difference["font"]), difference["input"]))
+            for index, glyphName, referencePosition, position in difference["value"]:
+                print("    %d %s %s -> %s" % (index, glyphName, referencePosition, position))
+    print("%d differences in %d inputs over %d fonts" % (len(differences), len(inputs), len(comparison.paths)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+import os
+import re
+import threading
+import weakref
+
+from fontTools.ufoLib.glifLib import readGlyphFromString
+
+
+advanceRE = re.compile(rb"<advance\b([^>]*)>")
+attributeRE = re.compile(rb"""(width|height)\s*=\s*["']([^"']*)["']""")
+
+
+class _Advance(object):
+
+    # glyph object for readGlyphFromString
+    width = 0
+    height = 0
+
+
+def scanGLIFAdvance(glif):
+    """
+    Return the advance width and height from glif data without parsing the outline.
+    """
+    end = glif.find(b"<outline")
+    if end == -1:
+        end = glif.find(b"<lib")
+    head = glif if end == -1 else glif[:end]
+    match = advanceRE.search(head)
+    if match is None:
+        if end == -1:
+            return 0, 0
+        # the advance element is not in the usual place, parse the whole glif
+        advance = _Advance()
+        readGlyphFromString(glif, advance)
+        return advance.width, advance.height
+    values = dict(width=0, height=0)
+    for attribute, value in attributeRE.findall(match.group(1)):
+        value = float(value)
+        if value.is_integer():
+            value = int(value)
+        values[attribute.decode()] = value
+    return values["width"], values["height"]
+
+
+class GlyphMetrics(object):
+
+    """
+    Advance widths and heights for the default layer of a defcon font,
+    without loading the glyphs.
+
+    Loaded glyphs give their current values, glyphs still on disk are
+    scanned for their advance element only. Scanned values are cached
+    by glif file and modification time.
+
+    Use `GlyphMetrics.forFont(font)` to get the shared metrics for a font.
+    """
+
+    _glyphMetrics = weakref.WeakKeyDictionary()
+    # glyphs directory path -> {glyphName: (modification time, (width, height))}
+    _glifCache = dict()
+    _glifCacheLock = threading.Lock()
+
+    @classmethod
+    def forFont(cls, font):
+        glyphMetrics = cls._glyphMetrics.get(font)
+        if glyphMetrics is None:
+            glyphMetrics = cls._glyphMetrics[font] = cls(font)
+        return glyphMetrics
+
+    def __init__(self, font):
+        self._layer = weakref.ref(font.layers.defaultLayer)
+        self._localGlifCache = dict()
+        self.loaded = 0
+        self.cached = 0
+        self.scanned = 0
+
+    def getMetrics(self, glyphNames):
+        """
+        Return a dict with the (width, height) for each glyph name.
+        """
+        layer = self._layer()
+        # the same split defcon makes between loaded glyphs and the glyph set
+        loadedGlyphs = layer._glyphs
+        glyphSet = layer._glyphSet
+        glifCache = None
+        directory = None
+        if glyphSet is not None:
+            try:
+                directory = glyphSet.fs.getsyspath("")
+            except Exception:
+                # not on the os file system (a zipped ufo), use the slower glyph set api
+                glifCache = self._localGlifCache
+            else:
+                with self._glifCacheLock:
+                    glifCache = self._glifCache.setdefault(directory, dict())
+        metrics = dict()
+        for glyphName in glyphNames:
+            glyph = loadedGlyphs.get(glyphName)
+            if glyph is None and (glyphSet is None or glyphName not in glyphSet or glyphName not in layer):
+                # let defcon raise for unknown glyphs
+                glyph = layer[glyphName]
+            if glyph is not None:
+                metrics[glyphName] = glyph.width, glyph.height
+                self.loaded += 1
+                continue
+            if directory is not None:
+                path = os.path.join(directory, glyphSet.contents[glyphName])
+                modificationTime = os.stat(path).st_mtime_ns
+            else:
+                modificationTime = glyphSet.getGLIFModificationTime(glyphName)
+            cached = glifCache.get(glyphName)
+            if cached is not None and cached[0] == modificationTime:
+                metrics[glyphName] = cached[1]
+                self.cached += 1
+                continue
+            if directory is not None:
+                with open(path, "rb") as f:
+                    glif = f.read()
+            else:
+                glif = glyphSet.getGLIF(glyphName)
+            advance = scanGLIFAdvance(glif)
+            glifCache[glyphName] = modificationTime, advance
+            metrics[glyphName] = advance
+            self.scanned += 1
+        return metrics
+
+    def info(self):
+        return dict(loaded=self.loaded, cached=self.cached, scanned=self.scanned)
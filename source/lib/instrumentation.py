@@ -0,0 +1,87 @@
+import sys
+import time
+import cProfile
+import pstats
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class Instrumentation(object):
+
+    """
+    Collect wall time and allocation counters per named stage.
+
+    `lastRun` holds a dict for each stage of the last run, `totals` the
+    accumulated values per stage name.
+
+    `netAllocatedBlocks` is the change in live memory blocks over a stage,
+    not the number of allocations: blocks allocated and freed again within
+    the stage are not counted. When tracemalloc is tracing the change in
+    traced memory is added as `netAllocatedBytes`.
+    """
+
+    def __init__(self):
+        self.lastRun = []
+        self.totals = OrderedDict()
+        self.profile = None
+
+    def reset(self):
+        self.lastRun = []
+
+    @contextmanager
+    def stage(self, name):
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            startBytes = tracemalloc.get_traced_memory()[0]
+        startBlocks = sys.getallocatedblocks()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = dict(
+                name=name,
+                time=time.perf_counter() - start,
+                netAllocatedBlocks=sys.getallocatedblocks() - startBlocks,
+            )
+            if tracing:
+                record["netAllocatedBytes"] = tracemalloc.get_traced_memory()[0] - startBytes
+            self.lastRun.append(record)
+            total = self.totals.get(name)
+            if total is None:
+                total = self.totals[name] = dict(count=0, time=0, netAllocatedBlocks=0)
+            total["count"] += 1
+            total["time"] += record["time"]
+            total["netAllocatedBlocks"] += record["netAllocatedBlocks"]
+
+    @contextmanager
+    def profiled(self):
+        """
+        Capture a cProfile profile, available as `pstats.Stats` in `profile`.
+        """
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            self.profile = pstats.Stats(profiler)
+
+    def asDict(self):
+        return dict(
+            lastRun=[dict(record) for record in self.lastRun],
+            totals={name: dict(total) for name, total in self.totals.items()}
+        )
+
+    def report(self):
+        lines = []
+        for name, total in self.totals.items():
+            lines.append("%-30s %6d %10.4fs %10d blocks" % (name, total["count"], total["time"], total["netAllocatedBlocks"]))
+        return "\n".join(lines)
+
+    def log(self, logger):
+        """
+        Send the stages of the last run to a `logging.Logger` like object.
+        """
+        for record in self.lastRun:
+            logger.debug("%s %.4fs %d blocks", record["name"], record["time"], record["netAllocatedBlocks"])
@@ -0,0 +1,210 @@
+"""
+A headless shaping server, one JSON object per line over a local socket.
+
+    python shapingServer.py --socket /tmp/featurePreview.sock
+
+Requests:
+
+    {"id": 1, "font": "/path/to/font.ufo", "text": "Hamburg", "features": {"ss01": true}}
+    {"id": 2, "font": "/path/to/font.ufo", "glyphNames": ["a", "b"], "script": "latn", "rightToLeft": false}
+    {"id": 3, "method": "fonts"}
+
+Optional shaping keys are `script`, `langSys`, `rightToLeft`, `case` and `features`.
+Each request gets one response line with the same `id`, either the shaped
+`glyphNames`, `clusters`, `xPlacements`, `yPlacements`, `xAdvances` and
+`yAdvances` or an `error`.
+"""
+import os
+import time
+import json
+import socket
+import asyncio
+import argparse
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import defcon
+
+from featureFont import FeatureFont
+from featureCache import statFingerprint
+
+
+def defaultSocketPath():
+    return os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"), "featurePreview.sock")
+
+
+class FontPool(object):
+
+    """
+    Compiled FeatureFont objects keyed by UFO path.
+
+    A font is recompiled when the fingerprint of the UFO files (and the
+    included feature files) changed. Compiles run in an executor, requests
+    for a font that is being compiled wait for that same compile.
+
+    The files of a compiled font are scanned in a separate executor, so a
+    request for a compiled font never waits for a compile, and at most once
+    every `checkInterval` seconds per font.
+    """
+
+    def __init__(self, featureFontClass=FeatureFont, maxFonts=8, workers=2, checkInterval=0.5):
+        self.featureFontClass = featureFontClass
+        self.maxFonts = maxFonts
+        self.checkInterval = checkInterval
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.scanExecutor = ThreadPoolExecutor(max_workers=1)
+        # path -> (fingerprint, featureFont, included paths, time of the last scan)
+        self._fonts = OrderedDict()
+        # (path, fingerprint) -> future
+        self._compiling = dict()
+
+    async def getFeatureFont(self, path):
+        loop = asyncio.get_running_loop()
+        path = os.path.abspath(path)
+        entry = self._fonts.get(path)
+        if entry is not None and time.monotonic() - entry[3] < self.checkInterval:
+            self._fonts.move_to_end(path)
+            return entry[1]
+        includedPaths = entry[2] if entry is not None else []
+        fingerprint = await loop.run_in_executor(self.scanExecutor, statFingerprint, [path] + includedPaths)
+        if entry is not None and entry[0] == fingerprint:
+            self._fonts[path] = fingerprint, entry[1], includedPaths, time.monotonic()
+            self._fonts.move_to_end(path)
+            return entry[1]
+        key = path, fingerprint
+        future = self._compiling.get(key)
+        if future is None:
+            future = self._compiling[key] = loop.run_in_executor(self.executor, self._compile, path)
+            future.add_done_callback(lambda future: self._compiling.pop(key, None))
+        featureFont, compiledIncludedPaths = await future
+        if compiledIncludedPaths != includedPaths:
+            includedPaths = compiledIncludedPaths
+            fingerprint = await loop.run_in_executor(self.scanExecutor, statFingerprint, [path] + includedPaths)
+        self._fonts[path] = fingerprint, featureFont, includedPaths, time.monotonic()
+        self._fonts.move_to_end(path)
+        while len(self._fonts) > self.maxFonts:
+            self._fonts.popitem(last=False)
+        return featureFont
+
+    def _compile(self, path):
+        font = defcon.Font(path)
+        featureFont = self.featureFontClass(font)
+        includedPaths = [includedPath for includedPath, _ in featureFont._getIncludedFeatureFiles()]
+        return featureFont, includedPaths
+
+    def info(self):
+        return [dict(path=path, fingerprint=entry[0]) for path, entry in self._fonts.items()]
+
+
+class ShapingServer(object):
+
+    # the longest request line
+    lineLimit = 16 * 1024 * 1024
+
+    def __init__(self, fontPool=None):
+        if fontPool is None:
+            fontPool = FontPool()
+        self.fontPool = fontPool
+
+    async def handleClient(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                response = await self.handleLine(line)
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def handleLine(self, line):
+        requestID = None
+        try:
+            request = json.loads(line)
+            requestID = request.get("id")
+            response = await self.handleRequest(request)
+        except Exception as error:
+            response = dict(error="%s: %s" % (error.__class__.__name__, error), traceback=traceback.format_exc())
+        response["id"] = requestID
+        return response
+
+    async def handleRequest(self, request):
+        method = request.get("method", "shape")
+        if method == "fonts":
+            return dict(fonts=self.fontPool.info())
+        if method != "shape":
+            raise ValueError("unknown method '%s'" % method)
+        featureFont = await self.fontPool.getFeatureFont(request["font"])
+        # shaping runs in the event loop, the feature states can not be changed by an other request
+        featureFont.featureStates = dict(request.get("features", {}))
+        glyphRun = featureFont.shape(
+            request.get("glyphNames", request.get("text", "")),
+            script=request.get("script", "latn"),
+            langSys=request.get("langSys"),
+            rightToLeft=request.get("rightToLeft"),
+            case=request.get("case", "unchanged")
+        )
+        return dict(
+            glyphNames=glyphRun.glyphNames(),
+            clusters=list(glyphRun.clusters),
+            xPlacements=list(glyphRun.xPlacements),
+            yPlacements=list(glyphRun.yPlacements),
+            xAdvances=list(glyphRun.xAdvances),
+            yAdvances=list(glyphRun.yAdvances),
+        )
+
+    async def serve(self, socketPath=None, host=None, port=None):
+        if port is not None:
+            server = await asyncio.start_server(self.handleClient, host or "127.0.0.1", port, limit=self.lineLimit)
+        else:
+            if socketPath is None:
+                socketPath = defaultSocketPath()
+            if os.path.exists(socketPath):
+                os.remove(socketPath)
+            server = await asyncio.start_unix_server(self.handleClient, socketPath, limit=self.lineLimit)
+        async with server:
+            await server.serve_forever()
+
+
+def request(socketPath=None, **kwargs):
+    """
+    Send a single request to a running server and return the response.
+    """
+    if socketPath is None:
+        socketPath = defaultSocketPath()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socketPath)
+        client.sendall(json.dumps(kwargs).encode("utf-8") + b"\n")
+        data = b""
+        while not data.endswith(b"\n"):
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return json.loads(data)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Serve FeatureFont shaping requests as JSON lines.")
+    parser.add_argument("--socket", help="unix socket path (default: %s)" % defaultSocketPath())
+    parser.add_argument("--host", help="serve over tcp on this host")
+    parser.add_argument("--port", type=int, help="serve over tcp on this port")
+    parser.add_argument("--maxFonts", type=int, default=8, help="number of compiled fonts to keep")
+    parser.add_argument("--workers", type=int, default=2, help="number of fonts compiling at the same time")
+    parser.add_argument("--checkInterval", type=float, default=0.5, help="seconds between checks of a compiled font for changed files")
+    args = parser.parse_args(args)
+    server = ShapingServer(FontPool(maxFonts=args.maxFonts, workers=args.workers, checkInterval=args.checkInterval))
+    try:
+        asyncio.run(server.serve(socketPath=args.socket, host=args.host, port=args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()